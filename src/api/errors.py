@@ -0,0 +1,15 @@
+"""
+HTTP error responses shared by the API routes.
+"""
+from fastapi import HTTPException
+
+from src.services.upstream import OverloadedError
+
+
+def overloaded_exception(error: OverloadedError) -> HTTPException:
+    """Build the 503 response, with a Retry-After header, for an overloaded service."""
+    return HTTPException(
+        status_code=503,
+        detail="The AI service is currently overloaded. Please try again shortly.",
+        headers={"Retry-After": str(error.retry_after)},
+    )
@@ -2,41 +2,133 @@
 API routes for personality-specific endpoints.
 """
 from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Literal, Optional, Tuple
 
-from src.models.schemas import Question, Answer, PersonalityInfo
-from src.services.ai_agent import AIAgent
-from src.services.personality_manager import list_personalities, get_personality_info
+from src.config import settings
+from src.api.errors import overloaded_exception
+from src.api.sse import stream_answer_events, sse_response
+from src.models.schemas import Question, Answer, PersonalityInfo, SessionStats
+from src.services.ai_agent import AIAgent, check_capacity
+from src.services.history_store import get_history_store
+from src.services.session_store import SessionStore
+from src.services.personality_manager import (
+    get_personality_info,
+    list_personalities,
+    personality_exists,
+)
+from src.services.upstream import OverloadedError
 
 # Create router
 router = APIRouter(prefix="/personalities", tags=["personalities"])
 
-# Dictionary to store AI agent instances for each personality and user
-personality_agents: Dict[str, Dict[str, AIAgent]] = {}
+# Bounded store of conversation sessions keyed by (personality, user), with
+# None as the personality of the general /ask endpoints. Sessions are
+# lightweight: the vector store and clients are shared per personality by the
+# retrieval engine.
+def _release_session(key: Tuple[Optional[str], Optional[str]], agent: AIAgent):
+    """
+    Free an evicted session's history when it is kept in this process.
+
+    External history backends keep the history so that another worker, or
+    this one after re-creating the session, can continue the conversation.
+    """
+    if settings.SESSION_BACKEND == "memory":
+        agent.reset_conversation()
+
 
+personality_agents = SessionStore(
+    max_entries=settings.SESSION_MAX_ENTRIES,
+    ttl_seconds=settings.SESSION_TTL_SECONDS,
+    on_evict=_release_session,
+)
 
-def get_agent_for_user(personality_id: str, user_id: str = "default") -> AIAgent:
+
+def get_agent_for_user(
+    personality_id: Optional[str], user_id: str = "default"
+) -> AIAgent:
     """
-    Get or create an AI agent for a specific personality and user.
+    Get or create a conversation session for a specific personality and user.
 
     Args:
-        personality_id: The personality ID
+        personality_id: The personality ID, or None for the general agent
         user_id: The user ID
 
     Returns:
         An AIAgent instance
     """
-    # Initialize the dictionary for this personality if it doesn't exist
-    if personality_id not in personality_agents:
-        personality_agents[personality_id] = {}
+    return personality_agents.get_or_create(
+        (personality_id, user_id),
+        lambda: AIAgent(
+            personality_id=personality_id, session_key=_session_key(personality_id, user_id)
+        ),
+    )
+
+
+def _session_key(personality_id: Optional[str], user_id: str) -> str:
+    """Key of a conversation's history in the history store."""
+    return f"{personality_id or 'general'}:{user_id}"
+
+
+def reset_session(personality_id: Optional[str], user_id: str):
+    """
+    Drop a conversation session and its stored history.
+
+    The shared engine is kept. This reads and writes the history store, so
+    call it from a worker thread when on the event loop.
+
+    Args:
+        personality_id: The personality ID, or None for the general agent
+        user_id: The user or session ID
+    """
+    personality_agents.drop((personality_id, user_id))
+    get_history_store().clear(_session_key(personality_id, user_id))
 
-    # Create a new agent for this user if one doesn't exist
-    if user_id not in personality_agents[personality_id]:
-        personality_agents[personality_id][user_id] = AIAgent(
-            personality_id=personality_id
+
+def require_personality(personality_id: str):
+    """
+    Reject a personality ID that is not registered.
+
+    Every known personality gets a shared engine that lives for the whole
+    process, so unknown IDs must not reach session or engine creation.
+
+    Args:
+        personality_id: The personality ID from the URL
+
+    Raises:
+        HTTPException: 404 if the personality does not exist
+    """
+    if not personality_exists(personality_id):
+        raise HTTPException(
+            status_code=404, detail=f"Personality '{personality_id}' not found"
         )
 
-    return personality_agents[personality_id][user_id]
+
+def get_agent_for_question(
+    personality_id: Optional[str], question: Question
+) -> AIAgent:
+    """
+    Get the agent that should answer a question.
+
+    Conversations are keyed by `session_id`, then `user_id`. A question that
+    carries its own `context` is stateless, so it is served by one shared
+    agent per personality whose memory is never used.
+
+    Args:
+        personality_id: The personality ID, or None for the general agent
+        question: The question data
+
+    Returns:
+        An AIAgent instance
+    """
+    if question.context is not None:
+        return personality_agents.get_or_create(
+            (personality_id, None), lambda: AIAgent(personality_id=personality_id)
+        )
+    return get_agent_for_user(
+        personality_id=personality_id,
+        user_id=question.session_id or question.user_id or "default",
+    )
 
 
 @router.get("/", response_model=List[PersonalityInfo])
@@ -50,6 +142,17 @@ async def get_all_personalities():
     return list_personalities()
 
 
+@router.get("/sessions/stats", response_model=SessionStats)
+async def get_session_stats():
+    """
+    Get size and hit, miss and eviction counters for the session store.
+
+    Returns:
+        Session store statistics
+    """
+    return SessionStats(**personality_agents.stats())
+
+
 @router.get("/{personality_id}", response_model=PersonalityInfo)
 async def get_personality(personality_id: str):
     """
@@ -61,12 +164,8 @@ async def get_personality(personality_id: str):
     Returns:
         Personality information
     """
+    require_personality(personality_id)
     personality = get_personality_info(personality_id)
-    if not personality:
-        raise HTTPException(
-            status_code=404, detail=f"Personality '{personality_id}' not found"
-        )
-
     personality["id"] = personality_id
     return personality
 
@@ -83,33 +182,71 @@ async def ask_personality_question(personality_id: str, question: Question):
     Returns:
         The AI's answer
     """
+    require_personality(personality_id)
     try:
-        # Get or create an agent for this personality and user
-        agent = get_agent_for_user(
-            personality_id=personality_id, user_id=question.user_id or "default"
-        )
+        # Get or create an agent for this personality and session. The first
+        # session for a personality may load its vector store, so keep that
+        # off the event loop.
+        agent = await run_in_threadpool(get_agent_for_question, personality_id, question)
 
         # Get the answer
-        answer_text, sources = agent.ask(question.text)
+        answer = await agent.aask(question.text, question.context)
 
         # Return the formatted answer
-        return Answer(text=answer_text, sources=sources, personality_id=personality_id)
+        return Answer(
+            text=answer.text,
+            sources=answer.sources,
+            personality_id=personality_id,
+            cached=answer.cached,
+        )
+    except OverloadedError as e:
+        raise overloaded_exception(e)
     except Exception as e:
-        # Handle errors
-        error_msg = str(e)
-        if "overloaded" in error_msg.lower():
-            raise HTTPException(
-                status_code=503,
-                detail="The AI service is currently overloaded. Please try again in a few minutes.",
-            )
         raise HTTPException(
-            status_code=500, detail=f"Error processing question: {error_msg}"
+            status_code=500, detail=f"Error processing question: {str(e)}"
         )
 
 
+@router.post("/{personality_id}/ask/stream")
+async def ask_personality_question_stream(
+    personality_id: str,
+    question: Question,
+    mode: Literal["token", "sentence"] = "sentence",
+):
+    """
+    Ask a question to a specific AI personality and stream the answer.
+
+    Args:
+        personality_id: The ID of the personality to ask
+        question: The question data
+        mode: "token" to stream raw tokens, "sentence" to stream whole sentences
+
+    Returns:
+        A text/event-stream response of answer, sources and done events
+    """
+    require_personality(personality_id)
+    try:
+        check_capacity()
+    except OverloadedError as e:
+        raise overloaded_exception(e)
+
+    agent = await run_in_threadpool(get_agent_for_question, personality_id, question)
+    return sse_response(
+        stream_answer_events(
+            agent,
+            question.text,
+            mode=mode,
+            personality_id=personality_id,
+            context=question.context,
+        )
+    )
+
+
 @router.post("/{personality_id}/reset")
 async def reset_personality_conversation(
-    personality_id: str, user_id: Optional[str] = None
+    personality_id: str,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
 ):
     """
     Reset the conversation history for a specific personality.
@@ -117,18 +254,12 @@ async def reset_personality_conversation(
     Args:
         personality_id: The ID of the personality
         user_id: Optional user ID (defaults to 'default')
+        session_id: Optional session ID, which takes precedence over user_id
 
     Returns:
         Success message
     """
-    user_id = user_id or "default"
-
-    # Check if there's an agent for this personality and user
-    if (
-        personality_id in personality_agents
-        and user_id in personality_agents[personality_id]
-    ):
-        # Reset the conversation
-        personality_agents[personality_id][user_id].reset_conversation()
+    user_id = session_id or user_id or "default"
+    await run_in_threadpool(reset_session, personality_id, user_id)
 
     return {"status": "success", "message": "Conversation reset successfully"}
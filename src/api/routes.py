@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import Literal, Optional
 from src.models.schemas import Question, Answer, HealthCheck
-from src.services.ai_agent import AIAgent
-import time
+from src.services.ai_agent import check_capacity
+from src.services.metrics import render_metrics
+from src.services.upstream import OverloadedError
+from src.services.retrieval_engine import (
+    STATUS_ERROR,
+    STATUS_FALLBACK,
+    STATUS_LOADING,
+    get_engine_status,
+)
+from src.api.errors import overloaded_exception
+from src.api.personality_routes import get_agent_for_question, reset_session
+from src.api.sse import stream_answer_events, sse_response
 
 router = APIRouter()
 
-# Create a single instance of AIAgent to be reused
-ai_agent = AIAgent()
-
 
 @router.get("/")
 async def root():
@@ -16,8 +25,38 @@ async def root():
 
 @router.get("/health", response_model=HealthCheck)
 async def health_check():
-    """Health check endpoint to verify the API is running."""
-    return HealthCheck(version="1.0.0")
+    """
+    Health check endpoint to verify the API is running.
+
+    Always answers immediately; `ready` is false while any engine is still
+    loading or failed to load, and `personalities` reports each engine.
+    `status` is "degraded" while any engine runs without a knowledge base.
+    """
+    personalities = get_engine_status()
+    ready = not any(
+        status in (STATUS_LOADING, STATUS_ERROR) for status in personalities.values()
+    )
+    degraded = STATUS_FALLBACK in personalities.values()
+    return HealthCheck(
+        status="degraded" if degraded else "ok",
+        version="1.0.0",
+        ready=ready,
+        personalities=personalities,
+    )
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics endpoint.
+
+    Serves per-stage latency histograms (condense, cache_embed, embed,
+    search, first_token, generation, total), LLM token counters, and the
+    state of the upstream limits, circuit breakers and caches, in the
+    Prometheus text format.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 
 @router.post("/ask", response_model=Answer)
@@ -28,31 +67,65 @@ async def ask_question(question: Question):
     This endpoint receives a question from the frontend and passes it to the AI agent
     that was trained on PDF documents. It returns the answer along with optional
     metadata like confidence score and sources.
+
+    Conversations are kept per `session_id`, then `user_id`, in the same
+    session store as the personality endpoints. Sessions are created on
+    first use, so importing this module never loads a vector database.
     """
     try:
-        # Measure response time for performance monitoring
-        start_time = time.time()
-
-        # Get answer from AI agent
-        answer_text, sources = ai_agent.ask(question.text, question.context)
-
-        # Calculate response time
-        response_time = time.time() - start_time
-        print(f"Response time: {response_time:.2f} seconds")
+        # Get answer from the general agent for this session
+        agent = await run_in_threadpool(get_agent_for_question, None, question)
+        answer = await agent.aask(question.text, question.context)
 
         # Return the answer
-        return Answer(text=answer_text, sources=sources)
+        return Answer(text=answer.text, sources=answer.sources, cached=answer.cached)
+    except OverloadedError as e:
+        raise overloaded_exception(e)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error processing question: {str(e)}"
         )
 
 
+@router.post("/ask/stream")
+async def ask_question_stream(
+    question: Question, mode: Literal["token", "sentence"] = "sentence"
+):
+    """
+    Process a question and stream the answer as Server-Sent Events.
+
+    Emits "token" or "sentence" events while the answer is generated,
+    followed by a "sources" event and a final "done" event.
+    """
+    try:
+        check_capacity()
+    except OverloadedError as e:
+        raise overloaded_exception(e)
+
+    agent = await run_in_threadpool(get_agent_for_question, None, question)
+    return sse_response(
+        stream_answer_events(agent, question.text, mode=mode, context=question.context)
+    )
+
+
 @router.post("/reset")
-async def reset_conversation():
-    """Reset the conversation history for the AI agent."""
+async def reset_conversation(
+    user_id: Optional[str] = None, session_id: Optional[str] = None
+):
+    """
+    Reset the conversation history of a general session.
+
+    Args:
+        user_id: Optional user ID (defaults to 'default')
+        session_id: Optional session ID, which takes precedence over user_id
+
+    Returns:
+        Success message
+    """
     try:
-        ai_agent.reset_conversation()
+        await run_in_threadpool(
+            reset_session, None, session_id or user_id or "default"
+        )
         return {"status": "success", "message": "Conversation reset successfully"}
     except Exception as e:
         raise HTTPException(
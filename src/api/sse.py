@@ -0,0 +1,110 @@
+"""
+Server-Sent Events helpers for streaming answers to voice clients.
+"""
+import json
+import re
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from fastapi.responses import StreamingResponse
+
+from src.services.ai_agent import AIAgent
+from src.services.upstream import OverloadedError
+
+# A sentence ends with Chinese or Japanese terminal punctuation, which is not
+# followed by a space, or with Latin terminal punctuation followed by
+# whitespace (so decimals and abbreviations mid-stream do not split)
+SENTENCE_BOUNDARY = re.compile(r"(?<=[。！？])\s*|(?<=[.!?])\s+")
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def split_sentences(buffer: str) -> Tuple[List[str], str]:
+    """
+    Split complete sentences off the front of a text buffer.
+
+    Args:
+        buffer: Text accumulated from the token stream
+
+    Returns:
+        Tuple of (complete_sentences, remaining_text)
+    """
+    parts = SENTENCE_BOUNDARY.split(buffer)
+    return [part for part in parts[:-1] if part.strip()], parts[-1]
+
+
+async def stream_answer_events(
+    agent: AIAgent,
+    question: str,
+    mode: str = "sentence",
+    personality_id: Optional[str] = None,
+    context: Optional[List[str]] = None,
+) -> AsyncIterator[str]:
+    """
+    Stream an agent's answer as Server-Sent Events.
+
+    In "token" mode every generated chunk is sent as a "token" event. In
+    "sentence" mode chunks are buffered and sent as whole "sentence" events so
+    a TTS system can start speaking as soon as the first sentence is complete.
+    The source list, and whether the answer came from the answer cache,
+    follow as a "sources" event, then a final "done" event.
+
+    Args:
+        agent: The agent to ask
+        question: The question text
+        mode: Either "token" or "sentence"
+        personality_id: Optional personality ID included with the sources
+        context: Optional client-supplied history for a stateless turn
+
+    Yields:
+        Formatted SSE messages
+    """
+    buffer = ""
+    cached = False
+    try:
+        async for kind, payload in agent.astream(question, context):
+            if kind == "cached":
+                cached = payload
+            elif kind == "sources":
+                if buffer.strip():
+                    yield format_sse("sentence", {"text": buffer.strip()})
+                buffer = ""
+                yield format_sse(
+                    "sources",
+                    {
+                        "sources": payload,
+                        "personality_id": personality_id,
+                        "cached": cached,
+                    },
+                )
+            elif mode == "token":
+                yield format_sse("token", {"text": payload})
+            else:
+                buffer += payload
+                sentences, buffer = split_sentences(buffer)
+                for sentence in sentences:
+                    yield format_sse("sentence", {"text": sentence})
+    except OverloadedError as e:
+        yield format_sse(
+            "error",
+            {
+                "detail": "The AI service is currently overloaded. Please try again shortly.",
+                "retry_after": e.retry_after,
+            },
+        )
+    except Exception as e:
+        print(f"Error while streaming answer: {e}")
+        yield format_sse("error", {"detail": f"Error processing question: {str(e)}"})
+
+    yield format_sse("done", {})
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Wrap an SSE message iterator in a streaming HTTP response."""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,166 @@
+"""
+Latency benchmark for shared HTTP clients.
+
+Starts a local mock of the Anthropic Messages API and compares, on a warm
+worker, three ways of calling it:
+
+- fresh_pool: a new chat model with its own connection pool per session
+- per_session: a new chat model per session with the library's default pool
+- shared: the process-wide pooled model from src.services.clients
+
+The mock delays every new connection by --handshake-ms to stand in for TCP
+and TLS setup to the real API.
+
+Usage:
+    python -m src.bench_http_clients [--requests N] [--handshake-ms MS] [--response-ms MS]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from functools import cached_property
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+MOCK_MESSAGE = {
+    "id": "msg_mock",
+    "type": "message",
+    "role": "assistant",
+    "model": "mock",
+    "content": [{"type": "text", "text": "Hello from the mock server."}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 10, "output_tokens": 6},
+}
+
+
+def start_mock_server(handshake_ms: float, response_ms: float) -> ThreadingHTTPServer:
+    """Serve canned Messages API responses on a free local port."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            # Called once per connection: simulate connection setup cost
+            time.sleep(handshake_ms / 1000)
+            super().setup()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(response_ms / 1000)
+            body = json.dumps(MOCK_MESSAGE).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(call: Callable[[], None], requests: int, warmup: int = 5) -> Dict[str, float]:
+    """Time sequential calls after a warm-up and return p50 and p99 in milliseconds."""
+    for _ in range(warmup):
+        call()
+
+    latencies: List[float] = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {"p50": statistics.median(latencies), "p99": percentiles[98]}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare per-session and shared Anthropic clients against a mock server."
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--handshake-ms",
+        type=float,
+        default=30,
+        help="Delay added to every new connection (default: 30)",
+    )
+    parser.add_argument(
+        "--response-ms",
+        type=float,
+        default=5,
+        help="Delay added to every response (default: 5)",
+    )
+    args = parser.parse_args(argv)
+
+    server = start_mock_server(args.handshake_ms, args.response_ms)
+    os.environ["ANTHROPIC_API_URL"] = f"http://127.0.0.1:{server.server_port}"
+
+    # Import after pointing the clients at the mock server
+    import anthropic
+    from langchain_anthropic import ChatAnthropic
+    from src.config import settings
+    from src.services.clients import get_chat_model
+
+    settings.ANTHROPIC_API_KEY = settings.ANTHROPIC_API_KEY or "mock-key"
+    model_kwargs = {
+        "model": settings.ANTHROPIC_MODEL_NAME,
+        "temperature": 0.2,
+        "max_tokens": 2000,
+        "anthropic_api_key": settings.ANTHROPIC_API_KEY,
+    }
+
+    class FreshPoolChatAnthropic(ChatAnthropic):
+        """ChatAnthropic with its own connection pool, as each session used to have."""
+
+        @cached_property
+        def _client(self) -> anthropic.Client:
+            return anthropic.Client(**self._client_params)
+
+    def fresh_pool():
+        FreshPoolChatAnthropic(**model_kwargs).invoke("Hello")
+
+    def per_session():
+        # New model object per session; recent langchain-anthropic versions
+        # share a default pool between instances with the same settings
+        ChatAnthropic(**model_kwargs).invoke("Hello")
+
+    shared_model = get_chat_model(
+        settings.ANTHROPIC_MODEL_NAME, temperature=0.2, max_tokens=2000
+    )
+
+    def shared():
+        shared_model.invoke("Hello")
+
+    results = {
+        "fresh_pool": measure(fresh_pool, args.requests),
+        "per_session": measure(per_session, args.requests),
+        "shared": measure(shared, args.requests),
+    }
+    server.shutdown()
+
+    for name, result in results.items():
+        print(f"{name:12} p50 {result['p50']:7.2f} ms   p99 {result['p99']:7.2f} ms")
+    for baseline in ("fresh_pool", "per_session"):
+        change = {
+            stat: results["shared"][stat] - results[baseline][stat]
+            for stat in ("p50", "p99")
+        }
+        print(
+            f"shared vs {baseline}: p50 {change['p50']:+.2f} ms, "
+            f"p99 {change['p99']:+.2f} ms"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
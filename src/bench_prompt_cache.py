@@ -0,0 +1,268 @@
+"""
+Prompt caching check and benchmark against a local mock of the Messages API.
+
+Sends a personality's answer prompt for a series of different questions
+through the shared chat model, once with the static system prompt marked
+for prompt caching and once without. The mock server implements Anthropic's
+prompt cache for the request prefix up to the last cache_control
+breakpoint: the first request writes the prefix, later ones read it, and
+prefixes shorter than the model's minimum are not cached. Every uncached
+input token adds --ms-per-1k-tokens of delay per thousand, to stand in for
+prompt processing time. Streaming requests are answered with Server-Sent
+Events like the real API.
+
+The personality's real static prompt is measured first. Without the
+deepgov-modelspec submodule it is only a few hundred tokens, under the
+configured model's minimum, and the check fails rather than benchmarking a
+prompt the API would never cache.
+
+Token counts are read back from `avatar_llm_tokens_total`, so the run also
+checks the metrics. The check fails if cached requests do not carry a cache
+breakpoint on the system prompt or never read from the cache.
+
+Usage:
+    python -m src.bench_prompt_cache [--personality ID] [--requests N]
+        [--ms-per-1k-tokens MS]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from src.bench_http_clients import MOCK_MESSAGE, measure
+from src.services.context_packing import approximate_tokens
+
+
+def min_cacheable_tokens(model: str) -> int:
+    """Get the shortest prompt prefix the API caches for a model, in tokens."""
+    return 2048 if "haiku" in model else 1024
+
+
+def _blocks(content: Any) -> List[Dict[str, Any]]:
+    """Get a system prompt or message content as a list of content blocks."""
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return list(content or [])
+
+
+def _tokens(blocks: List[Dict[str, Any]]) -> int:
+    """Estimate the tokens of text blocks as the context budget counts them."""
+    return sum(approximate_tokens(block.get("text", "")) for block in blocks)
+
+
+def _sse_body(message: Dict[str, Any]) -> bytes:
+    """Encode a message as the Server-Sent Events of a streamed response."""
+    usage = message["usage"]
+    events = [
+        {
+            "type": "message_start",
+            "message": dict(message, content=[], stop_reason=None),
+        },
+        {
+            "type": "content_block_start",
+            "index": 0,
+            "content_block": {"type": "text", "text": ""},
+        },
+        *(
+            {
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": word},
+            }
+            for word in message["content"][0]["text"].split(" ")
+        ),
+        {"type": "content_block_stop", "index": 0},
+        {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": usage,
+        },
+        {"type": "message_stop"},
+    ]
+    return "".join(
+        f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events
+    ).encode("utf-8")
+
+
+def start_prompt_cache_server(ms_per_1k_tokens: float) -> ThreadingHTTPServer:
+    """
+    Serve Messages API responses with a simulated prompt cache on a free local port.
+
+    The server's `requests` list records whether each request marked its
+    system prompt for caching.
+    """
+    cache: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            system = _blocks(request.get("system"))
+            blocks = system + [
+                block
+                for message in request["messages"]
+                for block in _blocks(message["content"])
+            ]
+            server.requests.append(any("cache_control" in block for block in system))
+
+            # The cached prefix ends at the last breakpoint
+            breakpoints = [
+                i for i, block in enumerate(blocks) if "cache_control" in block
+            ]
+            prefix_end = breakpoints[-1] + 1 if breakpoints else 0
+            prefix_tokens = _tokens(blocks[:prefix_end])
+            cache_read = cache_write = 0
+            if prefix_tokens >= min_cacheable_tokens(request["model"]):
+                key = request["model"] + json.dumps(blocks[:prefix_end])
+                with lock:
+                    if key in cache:
+                        cache_read = prefix_tokens
+                    else:
+                        cache[key] = prefix_tokens
+                        cache_write = prefix_tokens
+            input_tokens = _tokens(blocks) - cache_read - cache_write
+
+            time.sleep((input_tokens + cache_write) * ms_per_1k_tokens / 1e6)
+            message = dict(MOCK_MESSAGE)
+            message["usage"] = dict(
+                MOCK_MESSAGE["usage"],
+                input_tokens=input_tokens,
+                cache_creation_input_tokens=cache_write,
+                cache_read_input_tokens=cache_read,
+            )
+            if request.get("stream"):
+                body = _sse_body(message)
+                content_type = "text/event-stream"
+            else:
+                body = json.dumps(message).encode("utf-8")
+                content_type = "application/json"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare cached and uncached answer prompts against a mock server."
+    )
+    parser.add_argument("--personality", default="community")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument(
+        "--ms-per-1k-tokens",
+        type=float,
+        default=20,
+        help="Delay per thousand uncached input tokens (default: 20)",
+    )
+    args = parser.parse_args(argv)
+
+    server = start_prompt_cache_server(args.ms_per_1k_tokens)
+    os.environ["ANTHROPIC_API_URL"] = f"http://127.0.0.1:{server.server_port}"
+
+    # Import after pointing the clients at the mock server
+    from prometheus_client import REGISTRY
+    from src.config import settings
+    from src.services.clients import get_chat_model
+    from src.services.metrics import ANSWER_TAG, run_config
+    from src.services.personality_manager import get_personality_class
+
+    settings.ANTHROPIC_API_KEY = settings.ANTHROPIC_API_KEY or "mock-key"
+    model = get_chat_model(
+        settings.ANTHROPIC_MODEL_NAME, temperature=0.2, max_tokens=2000
+    )
+    personality_class = get_personality_class(args.personality)
+    model_spec = personality_class._load_model_spec()
+
+    static_tokens = approximate_tokens(personality_class.get_static_prompt(model_spec))
+    minimum = min_cacheable_tokens(settings.ANTHROPIC_MODEL_NAME)
+    print(
+        f"static prompt of {args.personality}: about {static_tokens} tokens, "
+        f"{settings.ANTHROPIC_MODEL_NAME} caches from {minimum}"
+    )
+    if static_tokens < minimum:
+        print("WARNING: the static prompt is too short to be cached")
+
+    results = {}
+    tokens = {}
+    for mode, cache in (("uncached", False), ("cached", True)):
+        prompt = personality_class.get_chat_prompt_template(model_spec, cache=cache)
+        config = run_config(f"bench-{mode}")
+        label = config["metadata"]["personality"]
+        requests = iter(range(args.requests + 1))
+
+        def ask():
+            i = next(requests)
+            model.invoke(
+                prompt.format_prompt(
+                    context=f"Passage {i} about the neighbourhood budget. " * 50,
+                    question=f"What does passage {i} say about the budget?",
+                ),
+                config=config,
+            )
+
+        del server.requests[:]
+        results[mode] = measure(ask, args.requests, warmup=1)
+        results[mode]["marked"] = sum(server.requests)
+        tokens[mode] = {
+            kind: REGISTRY.get_sample_value(
+                "avatar_llm_tokens_total",
+                {"personality": label, "call": ANSWER_TAG, "kind": kind},
+            )
+            or 0
+            for kind in ("input", "cache_read", "cache_write")
+        }
+    server.shutdown()
+
+    calls = args.requests + 1
+    for mode, result in results.items():
+        counts = tokens[mode]
+        print(
+            f"{mode:9} p50 {result['p50']:7.2f} ms   p99 {result['p99']:7.2f} ms   "
+            f"input/call {counts['input'] / calls:7.0f}   "
+            f"cache read {counts['cache_read']:9.0f}   "
+            f"cache write {counts['cache_write']:7.0f}"
+        )
+
+    processed = tokens["cached"]["input"] - tokens["cached"]["cache_read"]
+    change = results["cached"]["p50"] - results["uncached"]["p50"]
+    print(
+        f"cached vs uncached: {processed / tokens['uncached']['input']:.1%} of "
+        f"input tokens processed, p50 {change:+.2f} ms"
+    )
+
+    failures = []
+    if results["cached"]["marked"] != calls:
+        failures.append("cached requests did not mark the system prompt for caching")
+    if results["uncached"]["marked"]:
+        failures.append("uncached requests marked the system prompt for caching")
+    if static_tokens < minimum:
+        failures.append(
+            f"the static prompt is under the {minimum}-token minimum of "
+            f"{settings.ANTHROPIC_MODEL_NAME}; is the model spec submodule checked out?"
+        )
+    elif not tokens["cached"]["cache_read"]:
+        failures.append("no cache reads")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Latency benchmark for the retrieval backends.
+
+Builds a Chroma store and its NumPy export from a synthetic corpus of random
+unit vectors, then times top-k retrieval through:
+
+- chroma: `Chroma.as_retriever(search_kwargs={"k": 4})`, the previous path
+- numpy: VectorSearchRetriever over the memory-mapped NumpyVectorStore
+
+Query embeddings are precomputed, so only the search itself is measured.
+Each query is a noisy copy of a corpus vector; the overlap of the two
+backends' results shows how often Chroma's approximate search agrees with
+the exact one.
+
+Usage:
+    python -m src.bench_vector_index [--chunks N] [--dim D] [--requests N] [--k K]
+"""
+import argparse
+import sys
+import tempfile
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.bench_http_clients import measure
+
+
+class LookupEmbeddings(Embeddings):
+    """Embeddings that look up precomputed vectors by text."""
+
+    def __init__(self, vectors: Dict[str, List[float]]):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors[text]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare Chroma and NumPy retrieval latency on a synthetic corpus."
+    )
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    from langchain_community.vectorstores import Chroma
+    from src.services.retrievers import VectorSearchRetriever
+    from src.services.vector_index import NumpyVectorStore, export_numpy_index
+
+    rng = np.random.default_rng(0)
+    corpus = rng.standard_normal((args.chunks, args.dim)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    texts = [f"chunk {i}" for i in range(args.chunks)]
+    queries = [f"query {i}" for i in range(args.requests)]
+    targets = rng.integers(0, args.chunks, size=args.requests)
+    noise = 0.5 * rng.standard_normal((args.requests, args.dim)) / np.sqrt(args.dim)
+    vectors = dict(zip(texts, corpus.tolist()))
+    vectors.update(zip(queries, (corpus[targets] + noise).tolist()))
+    embeddings = LookupEmbeddings(vectors)
+
+    with tempfile.TemporaryDirectory() as path:
+        vector_db = Chroma(persist_directory=path, embedding_function=embeddings)
+        for start in range(0, args.chunks, 1000):
+            vector_db.add_texts(
+                texts[start : start + 1000],
+                metadatas=[{"source": text} for text in texts[start : start + 1000]],
+                ids=texts[start : start + 1000],
+            )
+        export_numpy_index(vector_db, path, index_version="bench")
+
+        retrievers = {
+            "chroma": vector_db.as_retriever(search_kwargs={"k": args.k}),
+            "numpy": VectorSearchRetriever(
+                vectorstore=NumpyVectorStore.load(path, embeddings),
+                embeddings=embeddings,
+                k=args.k,
+            ),
+        }
+
+        results = {}
+        for name, retriever in retrievers.items():
+            next_query = iter(queries * 2)
+            results[name] = measure(
+                lambda: retriever.invoke(next(next_query)), args.requests, warmup=0
+            )
+
+        overlap = []
+        for query in queries:
+            found = [
+                {doc.page_content for doc in retriever.invoke(query)}
+                for retriever in retrievers.values()
+            ]
+            overlap.append(len(found[0] & found[1]) / args.k)
+
+    print(f"{args.chunks} chunks x {args.dim} dims, k={args.k}")
+    for name, result in results.items():
+        print(f"{name:8} p50 {result['p50']:7.3f} ms   p99 {result['p99']:7.3f} ms")
+    print(
+        f"speedup: p50 {results['chroma']['p50'] / results['numpy']['p50']:.1f}x, "
+        f"p99 {results['chroma']['p99'] / results['numpy']['p99']:.1f}x"
+    )
+    print(f"result overlap: {np.mean(overlap):.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
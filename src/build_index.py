@@ -0,0 +1,108 @@
+"""
+Offline index builder.
+
+Prebuilds the Chroma vector database and manifest for every personality so
+indexes can be baked into the Docker image and served with
+VECTOR_DB_READ_ONLY=true, keeping PDF parsing and embedding calls off the
+serving path.
+
+Usage:
+    python -m src.build_index [--output DIR] [--full] [personality_id ...]
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from typing import List, Optional
+
+from src.config import settings
+from src.services.ingestion import build_vector_db, create_embeddings, read_manifest
+from src.services.personalities import PERSONALITY_CLASSES
+
+
+def build_index(
+    personality_id: Optional[str], output_dir: str, full: bool = False
+) -> dict:
+    """
+    Update one personality's index in a staging copy and swap it into place.
+
+    The staging directory starts as a copy of the current index, so only new
+    or changed chunks are embedded.
+
+    Args:
+        personality_id: The personality ID, or None for the general engine
+        output_dir: Root directory holding one store per personality
+        full: Rebuild from scratch instead of updating the current index
+
+    Returns:
+        The manifest of the new index
+
+    Raises:
+        Exception: Any build error, after the staging directory is removed
+    """
+    name = personality_id or "general"
+    target_path = os.path.join(output_dir, name)
+    staging_path = f"{target_path}.building-{int(time.time())}"
+
+    print(f"Building index for {name}...")
+    try:
+        if os.path.exists(target_path) and not full:
+            shutil.copytree(target_path, staging_path)
+        build_vector_db(personality_id, staging_path, create_embeddings())
+    except Exception:
+        # Do not leave a partial staging copy next to the served indexes
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+
+    # Replace the previous index only once the new one is complete
+    if os.path.exists(target_path):
+        shutil.rmtree(target_path)
+    os.replace(staging_path, target_path)
+
+    return read_manifest(target_path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Prebuild personality vector databases from PDF_DIR."
+    )
+    parser.add_argument(
+        "personalities",
+        nargs="*",
+        help="Personality IDs to build (default: general and every personality)",
+    )
+    parser.add_argument(
+        "--output",
+        default=settings.VECTOR_DB_PATH,
+        help="Directory to write the indexes to (default: VECTOR_DB_PATH)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-embed everything instead of only new or changed chunks",
+    )
+    args = parser.parse_args(argv)
+
+    personality_ids = args.personalities or ["general", *PERSONALITY_CLASSES.keys()]
+    failed = []
+    for personality_id in personality_ids:
+        try:
+            manifest = build_index(
+                None if personality_id == "general" else personality_id,
+                args.output,
+                full=args.full,
+            )
+            print(
+                f"Built {personality_id}: index {manifest['index_version']}, "
+                f"{manifest['chunk_count']} chunks, {manifest['embedding_model']}"
+            )
+        except Exception as e:
+            print(f"Error building index for {personality_id}: {e}")
+            failed.append(personality_id)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
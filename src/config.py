@@ -32,6 +32,168 @@ class Settings(BaseSettings):
         os.getenv("ANTHROPIC_MODEL_NAME", "claude-3-haiku-20240307")
     )
 
+    EMBEDDING_MODEL_NAME: str = Field(
+        os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-ada-002")
+    )
+
+    # Disk cache for document embeddings; empty disables caching
+    EMBEDDING_CACHE_DIR: str = Field(
+        os.getenv(
+            "EMBEDDING_CACHE_DIR", os.path.join(PROJECT_ROOT, "data", "embedding_cache")
+        )
+    )
+
+    # Ingestion settings
+    INGEST_WORKERS: int = Field(
+        int(os.getenv("INGEST_WORKERS", str(min(8, os.cpu_count() or 1))))
+    )
+    EMBEDDING_BATCH_SIZE: int = Field(int(os.getenv("EMBEDDING_BATCH_SIZE", "256")))
+    EMBEDDING_CONCURRENCY: int = Field(int(os.getenv("EMBEDDING_CONCURRENCY", "4")))
+    EMBEDDING_MAX_RETRIES: int = Field(int(os.getenv("EMBEDDING_MAX_RETRIES", "6")))
+
+    # Only load prebuilt vector databases; never build them while serving
+    VECTOR_DB_READ_ONLY: bool = Field(
+        os.getenv("VECTOR_DB_READ_ONLY", "false").lower() in ("1", "true", "yes")
+    )
+
+    # Retrieval backend: "chroma" queries the Chroma store, "numpy" searches a
+    # memory-mapped export of it in process
+    VECTOR_BACKEND: str = Field(os.getenv("VECTOR_BACKEND", "chroma"))
+
+    # Retrieval mode: "vector", or "hybrid" to fuse BM25 and vector rankings.
+    # Hybrid retrieval fetches HYBRID_FETCH_K candidates from each ranking and
+    # skips the embedding call when the best BM25 match contains query terms
+    # carrying HYBRID_KEYWORD_COVERAGE of the query's weight (0 disables this)
+    RETRIEVAL_MODE: str = Field(os.getenv("RETRIEVAL_MODE", "vector"))
+    HYBRID_FETCH_K: int = Field(int(os.getenv("HYBRID_FETCH_K", "10")))
+    HYBRID_KEYWORD_COVERAGE: float = Field(
+        float(os.getenv("HYBRID_KEYWORD_COVERAGE", "0.9"))
+    )
+
+    # Context packing: retrieved chunks with a cosine similarity below
+    # CONTEXT_MIN_SCORE are dropped (0 keeps all) and the stuffed context is
+    # capped at about CONTEXT_TOKEN_BUDGET tokens (0 for no limit)
+    CONTEXT_MIN_SCORE: float = Field(float(os.getenv("CONTEXT_MIN_SCORE", "0")))
+    CONTEXT_TOKEN_BUDGET: int = Field(int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200")))
+
+    # Send the static personality prompt as a system block marked for
+    # Anthropic prompt caching; repeat calls within the cache lifetime read
+    # it from the cache at a fraction of the input token cost
+    PROMPT_CACHING: bool = Field(
+        os.getenv("PROMPT_CACHING", "true").lower() in ("1", "true", "yes")
+    )
+
+    # Session settings
+    SESSION_MAX_ENTRIES: int = Field(int(os.getenv("SESSION_MAX_ENTRIES", "10000")))
+    SESSION_TTL_SECONDS: int = Field(int(os.getenv("SESSION_TTL_SECONDS", "3600")))
+    SESSION_SWEEP_INTERVAL_SECONDS: int = Field(
+        int(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+    )
+
+    # Follow-up question condensing: "heuristic" skips the rewrite LLM call for
+    # questions that look standalone, "always" rewrites every follow-up.
+    # CONDENSE_MODEL_NAME optionally uses a smaller model for the rewrite.
+    CONDENSE_MODE: str = Field(os.getenv("CONDENSE_MODE", "heuristic"))
+    CONDENSE_MODEL_NAME: str = Field(os.getenv("CONDENSE_MODEL_NAME", ""))
+
+    # Conversation memory: "buffer" keeps everything, "summary" keeps recent
+    # turns within MEMORY_TOKEN_BUDGET and summarizes older ones
+    MEMORY_MODE: str = Field(os.getenv("MEMORY_MODE", "buffer"))
+    MEMORY_TOKEN_BUDGET: int = Field(int(os.getenv("MEMORY_TOKEN_BUDGET", "1000")))
+
+    # Connection pools shared by the OpenAI and Anthropic clients
+    HTTP_MAX_CONNECTIONS: int = Field(int(os.getenv("HTTP_MAX_CONNECTIONS", "100")))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    )
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = Field(
+        float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+    )
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = Field(
+        float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+    )
+    HTTP_TIMEOUT_SECONDS: float = Field(float(os.getenv("HTTP_TIMEOUT_SECONDS", "60")))
+
+    # Conversation history backend: "memory", "sqlite" or "redis". Writes to
+    # external backends are batched every SESSION_WRITE_FLUSH_INTERVAL_MS.
+    SESSION_BACKEND: str = Field(os.getenv("SESSION_BACKEND", "memory"))
+    SESSION_SQLITE_PATH: str = Field(
+        os.getenv(
+            "SESSION_SQLITE_PATH", os.path.join(PROJECT_ROOT, "data", "sessions.sqlite3")
+        )
+    )
+    REDIS_URL: str = Field(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    SESSION_WRITE_FLUSH_INTERVAL_MS: int = Field(
+        int(os.getenv("SESSION_WRITE_FLUSH_INTERVAL_MS", "20"))
+    )
+
+    # Concurrency settings; questions beyond MAX_CONCURRENT_ASKS wait in a
+    # queue of ASK_QUEUE_SIZE and are rejected with 503 when it is full
+    MAX_CONCURRENT_ASKS: int = Field(int(os.getenv("MAX_CONCURRENT_ASKS", "32")))
+    ASK_QUEUE_SIZE: int = Field(int(os.getenv("ASK_QUEUE_SIZE", "64")))
+    ASK_QUEUE_TIMEOUT_SECONDS: float = Field(
+        float(os.getenv("ASK_QUEUE_TIMEOUT_SECONDS", "10"))
+    )
+
+    # Upstream API limits, retries and circuit breaker
+    ANTHROPIC_MAX_CONCURRENCY: int = Field(
+        int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "16"))
+    )
+    OPENAI_MAX_CONCURRENCY: int = Field(int(os.getenv("OPENAI_MAX_CONCURRENCY", "32")))
+    UPSTREAM_QUEUE_SIZE: int = Field(int(os.getenv("UPSTREAM_QUEUE_SIZE", "64")))
+    UPSTREAM_QUEUE_TIMEOUT_SECONDS: float = Field(
+        float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_SECONDS", "10"))
+    )
+    UPSTREAM_MAX_RETRIES: int = Field(int(os.getenv("UPSTREAM_MAX_RETRIES", "3")))
+    UPSTREAM_RETRY_BASE_SECONDS: float = Field(
+        float(os.getenv("UPSTREAM_RETRY_BASE_SECONDS", "0.5"))
+    )
+    UPSTREAM_RETRY_MAX_SECONDS: float = Field(
+        float(os.getenv("UPSTREAM_RETRY_MAX_SECONDS", "8"))
+    )
+    CIRCUIT_FAILURE_THRESHOLD: int = Field(
+        int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    )
+    CIRCUIT_RESET_SECONDS: float = Field(float(os.getenv("CIRCUIT_RESET_SECONDS", "30")))
+
+    # Warm-up settings: pre-build every personality engine at startup
+    PREWARM_PERSONALITIES: bool = Field(
+        os.getenv("PREWARM_PERSONALITIES", "false").lower() in ("1", "true", "yes")
+    )
+
+    # Answers without a knowledge base: "canned" returns the personality's
+    # fixed response, "generate" a short generated one in the question's language
+    FALLBACK_MODE: str = Field(os.getenv("FALLBACK_MODE", "canned"))
+    FALLBACK_MAX_TOKENS: int = Field(int(os.getenv("FALLBACK_MAX_TOKENS", "120")))
+
+    # Share one generation between identical questions asked at the same time
+    COALESCE_REQUESTS: bool = Field(
+        os.getenv("COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+    )
+
+    # Record each pipeline stage as an OpenTelemetry span (needs opentelemetry-api
+    # and an SDK configured by the deployment, e.g. opentelemetry-instrument)
+    OTEL_TRACING: bool = Field(
+        os.getenv("OTEL_TRACING", "false").lower() in ("1", "true", "yes")
+    )
+
+    # Process-wide LRU cache of query embeddings shared by every personality;
+    # 0 disables it
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES: int = Field(
+        int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+    )
+
+    # Answer cache settings; a similarity threshold of 0 disables semantic matching
+    ANSWER_CACHE_MAX_ENTRIES: int = Field(
+        int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+    )
+    ANSWER_CACHE_TTL_SECONDS: int = Field(
+        int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    )
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = Field(
+        float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0"))
+    )
+
     class Config:
         env_file = ".env"
 
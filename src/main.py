@@ -1,11 +1,20 @@
 """
 Main entry point for the API application.
 """
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from src.api.routes import router as general_router
 from src.api.personality_routes import router as personality_router
+from src.api.personality_routes import personality_agents
+from src.config import settings
+from src.services.clients import close_http_clients
+from src.services.history_store import close_history_store
+from src.services.personalities import PERSONALITY_CLASSES
+from src.services.personality_manager import preload_prompts
+from src.services.retrieval_engine import warm_up_engines
 
 app = FastAPI(
     title="AI Avatar API",
@@ -26,6 +35,45 @@ app.add_middleware(
 app.include_router(general_router)
 app.include_router(personality_router)
 
+# Background tasks started with the application
+background_tasks = []
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """
+    Compile prompts, then start the idle-session eviction loop and the
+    engine warm-up.
+
+    Warm-up runs in the background so the server accepts connections
+    immediately; /health reports progress per personality.
+    """
+    preload_prompts()
+
+    background_tasks.append(
+        asyncio.create_task(
+            personality_agents.run_eviction_loop(
+                settings.SESSION_SWEEP_INTERVAL_SECONDS
+            )
+        )
+    )
+
+    warm_up_ids = [None]
+    if settings.PREWARM_PERSONALITIES:
+        warm_up_ids.extend(PERSONALITY_CLASSES.keys())
+    background_tasks.append(asyncio.create_task(warm_up_engines(warm_up_ids)))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Cancel background tasks, flush history writes and close HTTP clients."""
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    close_history_store()
+    await close_http_clients()
+
+
 if __name__ == "__main__":
     import uvicorn
 
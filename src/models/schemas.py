@@ -2,17 +2,22 @@
 Pydantic models for API request and response validation.
 """
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 
 class Question(BaseModel):
     text: str = Field(..., description="The question text from the user")
     user_id: Optional[str] = Field(None, description="Optional user identifier")
     session_id: Optional[str] = Field(
-        None, description="Optional session identifier for conversation tracking"
+        None,
+        description="Optional session identifier for conversation tracking; "
+        "takes precedence over user_id as the conversation key",
     )
     context: Optional[List[str]] = Field(
-        None, description="Optional previous conversation context"
+        None,
+        description="Optional previous conversation messages, alternating user and "
+        "assistant and starting with the user. When set, the turn is stateless: "
+        "the server neither reads nor stores conversation history",
     )
 
 
@@ -27,11 +32,34 @@ class Answer(BaseModel):
     personality_id: Optional[str] = Field(
         None, description="The ID of the personality that generated the answer"
     )
+    cached: bool = Field(
+        False, description="Whether the answer was served from the answer cache"
+    )
 
 
 class HealthCheck(BaseModel):
-    status: str = "ok"
+    status: str = Field(
+        "ok",
+        description='"ok", or "degraded" while any engine answers without a knowledge base',
+    )
     version: str
+    ready: bool = Field(
+        False, description="Whether every warmed-up engine has finished loading"
+    )
+    personalities: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Readiness of each personality engine (not_loaded, loading, ready, fallback, error)",
+    )
+
+
+class SessionStats(BaseModel):
+    size: int = Field(..., description="Number of sessions currently stored")
+    max_entries: int = Field(..., description="Maximum number of stored sessions")
+    hits: int = Field(..., description="Lookups that found an existing session")
+    misses: int = Field(..., description="Lookups that found no live session")
+    evictions: int = Field(
+        ..., description="Sessions removed because of the size limit or idle TTL"
+    )
 
 
 class PersonalityTag(BaseModel):
@@ -1,227 +1,455 @@
-import os
-from typing import List, Tuple, Dict, Optional
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores import Chroma
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain_anthropic import ChatAnthropic
-from langchain.schema.document import Document
-from langchain.chains.question_answering import load_qa_chain
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, List, NamedTuple, Tuple, Dict, Optional
+from langchain_core.messages import BaseMessage, get_buffer_string
 
 from src.config import settings
-from src.services.personality_manager import (
-    get_personality_prompt,
-    get_default_prompt,
+from src.services.coalescing import flight_key
+from src.services.fallback import FALLBACK_SOURCE
+from src.services.memory import (
+    TokenBudgetMemory,
+    create_memory,
+    messages_from_context,
 )
+from src.services.metrics import (
+    observe_stage,
+    personality_label,
+    run_config,
+    timed_stage,
+)
+from src.services.retrieval_engine import RetrievalEngine, get_engine
+from src.services.upstream import ConcurrencyLimiter, anthropic_upstream
+
+# Limits the number of questions in flight in this worker process; callers
+# beyond the bounded queue are rejected with OverloadedError
+ask_limiter = ConcurrencyLimiter(
+    "Question queue",
+    max_concurrency=settings.MAX_CONCURRENT_ASKS,
+    max_queue=settings.ASK_QUEUE_SIZE,
+    queue_timeout=settings.ASK_QUEUE_TIMEOUT_SECONDS,
+)
+
+# References to background summarization tasks so they are not collected early
+_background_tasks = set()
+
+
+def check_capacity():
+    """
+    Fail fast before starting a streamed answer that would be rejected.
+
+    Raises:
+        OverloadedError: If the question queue is full or the Anthropic
+            circuit is open
+    """
+    ask_limiter.check()
+    anthropic_upstream.check()
+
+
+def _finish_background_task(task: asyncio.Task):
+    """Forget a finished background task and log its error, if any."""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Error while summarizing conversation: {task.exception()}")
+
+
+def _prune_in_thread(memory: TokenBudgetMemory):
+    """Summarize a session's older turns on a background thread, logging errors."""
+    try:
+        memory.prune()
+    except Exception as e:
+        print(f"Error while summarizing conversation: {e}")
+
+
+class AgentAnswer(NamedTuple):
+    """An answer with its sources and whether it came from the answer cache."""
+
+    text: str
+    sources: List[str]
+    cached: bool = False
 
 
 class AIAgent:
-    def __init__(self, personality_id: Optional[str] = None):
+    """
+    A conversation session with one personality.
+
+    The vector store, clients, chain and answer cache are shared through the
+    personality's RetrievalEngine; the session itself only holds the
+    conversation memory.
+    """
+
+    def __init__(
+        self,
+        personality_id: Optional[str] = None,
+        engine: Optional[RetrievalEngine] = None,
+        session_key: Optional[str] = None,
+    ):
         self.personality_id = personality_id
-        self.embeddings = OpenAIEmbeddings(openai_api_key=settings.OPENAI_API_KEY)
-        self.is_fallback_mode = False
-
-        self.llm = ChatAnthropic(
-            temperature=0.2,
-            model=settings.ANTHROPIC_MODEL_NAME,
-            anthropic_api_key=settings.ANTHROPIC_API_KEY,
-            max_tokens=2000,
-        )
+        self.engine = engine or get_engine(personality_id)
 
-        if personality_id:
-            self.qa_prompt = get_personality_prompt(personality_id)
-            self.vector_db_path = os.path.join(settings.VECTOR_DB_PATH, personality_id)
-        else:
-            self.qa_prompt = get_default_prompt()
-            self.vector_db_path = os.path.join(settings.VECTOR_DB_PATH, "general")
+        # Initialize memory; with a session key the history lives in the
+        # configured history store so other workers can continue the session
+        self.memory = create_memory(self.engine.llm, session_key)
 
-        # Initialize memory
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history", return_messages=True, output_key="answer"
-        )
-        self.vector_db = None
-        self.conversation_chain = None
+        # Labels the metrics of every LangChain run made for this session
+        self.run_config = run_config(personality_id)
+        self.metrics_label = personality_label(personality_id)
 
-        # Initialize the vector database
-        self._initialize_vector_db()
+    @property
+    def is_fallback_mode(self) -> bool:
+        return self.engine.is_fallback_mode
 
-    def _initialize_vector_db(self):
-        """Initialize or load the vector database from PDFs."""
-        # Ensure the vector database directory exists
-        os.makedirs(self.vector_db_path, exist_ok=True)
+    @property
+    def conversation_chain(self):
+        return self.engine.conversation_chain
 
-        # Check if the vector database already exists
-        if os.path.exists(os.path.join(self.vector_db_path, "chroma.sqlite3")):
-            print(
-                f"Loading existing vector database for {self.personality_id or 'general'}..."
-            )
-            self.vector_db = Chroma(
-                persist_directory=self.vector_db_path,
-                embedding_function=self.embeddings,
-            )
-            self._create_conversation_chain()
-        else:
-            print(
-                f"Creating new vector database for {self.personality_id or 'general'}..."
-            )
-            # Process PDFs and create the vector database
-            self._create_vector_db_from_pdfs()
-
-        # Create the conversation chain
-        self.conversation_chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.vector_db.as_retriever(search_kwargs={"k": 4}),
-            memory=self.memory,
-            return_source_documents=True,
-            combine_docs_chain_kwargs={"prompt": self.qa_prompt},
-        )
+    def _ensure_ready(self):
+        """Pick up prompt changes and check that the engine can answer."""
+        self.engine.refresh_prompt()
+        if not self.conversation_chain and not self.is_fallback_mode:
+            raise ValueError("AI agent is not properly initialized")
 
-    def _create_conversation_chain(self):
-        """Create the conversation chain with the current vector database."""
-        if self.vector_db:
-            # Create normal conversation chain with retriever
-            self.conversation_chain = ConversationalRetrievalChain.from_llm(
-                llm=self.llm,
-                retriever=self.vector_db.as_retriever(search_kwargs={"k": 4}),
-                memory=self.memory,
-                return_source_documents=True,
-                combine_docs_chain_kwargs={"prompt": self.qa_prompt},
-            )
-            self.is_fallback_mode = False
-        else:
-            # Create fallback chain that doesn't use a retriever
-            print("WARNING: Using fallback mode without vector database")
+    def _load_history(self, context: Optional[List[str]]) -> List[BaseMessage]:
+        """
+        Get the chat history for a turn.
 
-            qa_chain = load_qa_chain(
-                llm=self.llm, chain_type="stuff", prompt=self.qa_prompt
-            )
-            # Create a simple QA chain without retrieval
-            self.conversation_chain = qa_chain
-            self.is_fallback_mode = True
-
-    def _create_vector_db_from_pdfs(self):
-        """Create a vector database from PDF files in the configured directory."""
-        documents = []
-
-        # If we have a personality ID, only load the corresponding PDF
-        if self.personality_id:
-            pdf_filename = f"{self.personality_id}.pdf"
-            pdf_path = os.path.join(settings.PDF_DIR, pdf_filename)
-
-            if os.path.exists(pdf_path):
-                try:
-                    loader = PyPDFLoader(pdf_path)
-                    documents.extend(loader.load())
-                    print(f"Loaded {len(documents)} documents from {pdf_filename}")
-                except Exception as e:
-                    print(f"Warning: Personality-specific PDF not found: {pdf_path}")
-                    self._load_all_pdfs(documents)
-            else:
-                self._load_all_pdfs(documents)
-
-        if not documents:
-            print("Warning: No PDFs were loaded. Creating minimal vector database.")
-            # Create a minimal document based on personality
-            if self.personality_id:
-                # Get personality name from ID with title case formatting
-                personality_name = " ".join(
-                    word.capitalize() for word in self.personality_id.split("-")
-                )
-                minimal_text = (
-                    f"This is the {personality_name} agent. "
-                    f"It specializes in providing advice and information related to {self.personality_id}. "
-                    "Since no detailed information is available, responses will be limited."
-                )
-            else:
-                minimal_text = (
-                    "This is a general AI assistant. "
-                    "Since no detailed information is available, responses will be limited."
-                )
+        When the client supplies `context` the turn is stateless: the history
+        comes from the request and this session's memory is neither read nor
+        written, so any worker can serve it.
+        """
+        if context is not None:
+            return messages_from_context(context)
+        return self.memory.load_memory_variables({})["chat_history"]
 
-            # Create a minimal document
-            minimal_doc = Document(
-                page_content=minimal_text, metadata={"source": "minimal_info.txt"}
-            )
-            documents.append(minimal_doc)
+    def _save_turn(self, question: str, answer: str, context: Optional[List[str]]):
+        """Record a turn in this session's memory unless the turn is stateless."""
+        if context is None and not self.is_fallback_mode:
+            self.memory.save_context({"question": question}, {"answer": answer})
 
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200, separators=["\n\n", "\n", " ", ""]
-        )
-        chunks = text_splitter.split_documents(documents)
+    def _build_inputs(
+        self, question: str, chat_history: List[BaseMessage]
+    ) -> Dict[str, Any]:
+        """Build the chain inputs for a question and its chat history."""
+        # The shared chain is memoryless, so the caller supplies the history
+        return {"question": question, "chat_history": chat_history}
 
-        # Create and persist the vector database
-        self.vector_db = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embeddings,
-            persist_directory=self.vector_db_path,
-        )
-        self.vector_db.persist()
-        print(f"Created vector database with {len(chunks)} chunks")
-
-    def _load_all_pdfs(self, documents):
-        """Helper method to load all PDFs from the directory."""
-        # Get all PDF files
-        for filename in os.listdir(settings.PDF_DIR):
-            if filename.endswith(".pdf"):
-                pdf_path = os.path.join(settings.PDF_DIR, filename)
-                try:
-                    loader = PyPDFLoader(pdf_path)
-                    documents.extend(loader.load())
-                    print(f"Loaded {pdf_path}")
-                except Exception as e:
-                    print(f"Error loading {pdf_path}: {e}")
-
-    def ask(self, question: str, context: List[str] = None) -> Tuple[str, List[str]]:
+    def _handle_result(self, result: Dict[str, Any]) -> AgentAnswer:
+        """Extract the answer and sources from a chain result."""
+        answer = result.get("answer", "I'm sorry, I couldn't find an answer.")
+        source_docs = result.get("source_documents", [])
+
+        # Extract source information
+        sources = []
+        for doc in source_docs:
+            if hasattr(doc, "metadata") and "source" in doc.metadata:
+                sources.append(doc.metadata["source"])
+
+        return AgentAnswer(answer, list(set(sources)) if sources else [])
+
+    def _compact_memory(self):
+        """Summarize turns beyond the memory token budget in the background."""
+        if not (
+            isinstance(self.memory, TokenBudgetMemory) and self.memory.needs_pruning()
+        ):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Sync callers run on worker threads without an event loop
+            threading.Thread(
+                target=_prune_in_thread,
+                args=(self.memory,),
+                name="memory-summarizer",
+                daemon=True,
+            ).start()
+            return
+        task = loop.create_task(self.memory.aprune())
+        _background_tasks.add(task)
+        task.add_done_callback(_finish_background_task)
+
+    def _is_cacheable(self, chat_history: List[BaseMessage]) -> bool:
+        """Only first-turn answers are cached; later turns depend on the history."""
+        return not chat_history
+
+    def _cache_lookup(
+        self, question: str, embedding: Optional[List[float]]
+    ) -> Optional[AgentAnswer]:
+        hit = self.engine.answer_cache.get(question, embedding)
+        if hit is None:
+            return None
+
+        answer, sources = hit
+        return AgentAnswer(answer, sources, cached=True)
+
+    def _cache_store(
+        self, question: str, answer: AgentAnswer, embedding: Optional[List[float]]
+    ):
+        self.engine.answer_cache.put(question, answer.text, answer.sources, embedding)
+
+    def _validate_cache(self):
+        self.engine.answer_cache.validate(self.engine.cache_fingerprint)
+
+    def ask(self, question: str, context: Optional[List[str]] = None) -> AgentAnswer:
         """
         Ask a question to the AI agent and get an answer.
 
         Args:
             question: The question text
-            context: Optional list of previous conversation messages
+            context: Optional previous conversation messages, alternating user
+                and assistant; when given, this session's memory is not used
 
         Returns:
-            Tuple of (answer_text, source_documents)
+            AgentAnswer of (text, sources, cached)
+
+        Raises:
+            OverloadedError: If an upstream API is overloaded or unavailable
         """
-        if not self.conversation_chain:
-            raise ValueError("AI agent is not properly initialized")
+        self._ensure_ready()
+        with timed_stage("total", self.metrics_label):
+            return self._ask(question, context)
+
+    def _ask(self, question: str, context: Optional[List[str]]) -> AgentAnswer:
+        if self.is_fallback_mode:
+            return AgentAnswer(self.engine.fallback.answer(question), [FALLBACK_SOURCE])
 
         try:
-            # Get the answer
-            if self.is_fallback_mode:
-                # For fallback mode without vector DB
-                empty_docs = [Document(page_content="", metadata={"source": "empty"})]
-                result = self.conversation_chain(
-                    {"input_documents": empty_docs, "question": question}
-                )
-                answer = result.get(
-                    "output_text", "I'm sorry, I couldn't find an answer."
+            chat_history = self._load_history(context)
+            cacheable = self._is_cacheable(chat_history)
+            embedding = None
+            answer = None
+            if cacheable:
+                self._validate_cache()
+                if self.engine.answer_cache.uses_embeddings:
+                    with timed_stage("cache_embed", self.metrics_label):
+                        embedding = self.engine.embeddings.embed_query(question)
+                answer = self._cache_lookup(question, embedding)
+
+            if answer is None:
+                result = self.conversation_chain.invoke(
+                    self._build_inputs(question, chat_history), config=self.run_config
                 )
-                sources = ["No knowledge base available"]
-            else:
-                # Normal mode with vector DB
-                result = self.conversation_chain({"question": question})
-                answer = result.get("answer", "I'm sorry, I couldn't find an answer.")
-                source_docs = result.get("source_documents", [])
+                answer = self._handle_result(result)
+                if cacheable:
+                    self._cache_store(question, answer, embedding)
+
+            self._save_turn(question, answer.text, context)
+            self._compact_memory()
+            return answer
+
+        except Exception as e:
+            print(f"Error while processing question: {e}")
+            raise
+
+    async def aask(
+        self, question: str, context: Optional[List[str]] = None
+    ) -> AgentAnswer:
+        """
+        Ask a question without blocking the event loop.
+
+        Embedding, vector search and the Claude call all run through the
+        LangChain async APIs. At most MAX_CONCURRENT_ASKS questions are in
+        flight per process; further callers wait in a bounded queue.
+
+        Args:
+            question: The question text
+            context: Optional previous conversation messages, alternating user
+                and assistant; when given, this session's memory is not used
+
+        Returns:
+            AgentAnswer of (text, sources, cached)
+
+        Raises:
+            OverloadedError: If the question queue is full or an upstream API
+                is overloaded or unavailable
+        """
+        self._ensure_ready()
+        with timed_stage("total", self.metrics_label):
+            return await self._aask(question, context)
+
+    async def _aask(self, question: str, context: Optional[List[str]]) -> AgentAnswer:
+        if self.is_fallback_mode:
+            text = await self.engine.fallback.aanswer(question)
+            return AgentAnswer(text, [FALLBACK_SOURCE])
 
-                # Extract source information
-                sources = []
-                for doc in source_docs:
-                    if hasattr(doc, "metadata") and "source" in doc.metadata:
-                        sources.append(doc.metadata["source"])
+        try:
+            chat_history = await asyncio.to_thread(self._load_history, context)
+            cacheable = self._is_cacheable(chat_history)
+            embedding = None
+            answer = None
+            if cacheable:
+                self._validate_cache()
+                embedding = await self._aembed_for_cache(question)
+                answer = self._cache_lookup(question, embedding)
+
+            if answer is None:
+                answer = await self._coalesce(
+                    question,
+                    chat_history,
+                    lambda: self._agenerate(question, chat_history, cacheable, embedding),
+                )
 
-            return answer, list(set(sources)) if sources else []
+            self._save_turn(question, answer.text, context)
+            self._compact_memory()
+            return answer
 
         except Exception as e:
             print(f"Error while processing question: {e}")
-            # Return a fallback answer
-            return (
-                "I'm sorry, I encountered an error while processing your question. "
-                "Please try again or contact support if the issue persists.",
-                [],
+            raise
+
+    async def _agenerate(
+        self,
+        question: str,
+        chat_history: List[BaseMessage],
+        cacheable: bool,
+        embedding: Optional[List[float]],
+    ) -> AgentAnswer:
+        """Run the chain for a question and cache first-turn answers."""
+        async with ask_limiter:
+            result = await self.conversation_chain.ainvoke(
+                self._build_inputs(question, chat_history), config=self.run_config
             )
+        answer = self._handle_result(result)
+        if cacheable:
+            self._cache_store(question, answer, embedding)
+        return answer
+
+    async def _coalesce(
+        self,
+        question: str,
+        chat_history: List[BaseMessage],
+        generate: Callable[[], Any],
+    ) -> AgentAnswer:
+        """Share one generation between identical questions in flight."""
+        if not settings.COALESCE_REQUESTS:
+            return await generate()
+        key = flight_key(self.engine.cache_fingerprint, question, chat_history)
+        return await self.engine.inflight.run(key, generate)
+
+    async def _aembed_for_cache(self, question: str) -> Optional[List[float]]:
+        """Embed the question when the answer cache matches by similarity."""
+        if not self.engine.answer_cache.uses_embeddings:
+            return None
+        with timed_stage("cache_embed", self.metrics_label):
+            return await self.engine.embeddings.aembed_query(question)
+
+    async def astream(
+        self, question: str, context: Optional[List[str]] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Ask a question and stream the answer as it is generated.
+
+        Runs the same condense, retrieve and answer steps as the shared chain,
+        but streams the final Claude call token by token.
+
+        Args:
+            question: The question text
+            context: Optional previous conversation messages, alternating user
+                and assistant; when given, this session's memory is not used
+
+        Yields:
+            ("token", text) for each generated chunk, then ("sources", sources).
+            A ("cached", True) event precedes the answer on a cache hit.
+        """
+        self._ensure_ready()
+        start = time.perf_counter()
+        if self.is_fallback_mode:
+            yield "token", await self.engine.fallback.aanswer(question)
+            observe_stage("total", self.metrics_label, time.perf_counter() - start)
+            yield "sources", [FALLBACK_SOURCE]
+            return
+
+        chat_history = await asyncio.to_thread(self._load_history, context)
+        cacheable = self._is_cacheable(chat_history)
+        embedding = None
+        if cacheable:
+            self._validate_cache()
+            embedding = await self._aembed_for_cache(question)
+            cached = self._cache_lookup(question, embedding)
+            if cached:
+                self._save_turn(question, cached.text, context)
+                observe_stage("total", self.metrics_label, time.perf_counter() - start)
+                yield "cached", True
+                yield "token", cached.text
+                yield "sources", cached.sources
+                return
+
+        def generate() -> AsyncIterator[Tuple[str, Any]]:
+            return self._agenerate_stream(question, chat_history, cacheable, embedding)
+
+        if settings.COALESCE_REQUESTS:
+            # Identical questions in flight share one generation and token stream
+            key = flight_key(self.engine.cache_fingerprint, question, chat_history)
+            events = self.engine.inflight.stream(key, generate)
+        else:
+            events = generate()
+
+        answer_parts = []
+        sources = []
+        async for kind, value in events:
+            if kind == "token":
+                answer_parts.append(value)
+                yield kind, value
+            else:
+                sources = value
+
+        observe_stage("total", self.metrics_label, time.perf_counter() - start)
+        self._save_turn(question, "".join(answer_parts), context)
+        self._compact_memory()
+
+        yield "sources", sources
+
+    async def _agenerate_stream(
+        self,
+        question: str,
+        chat_history: List[BaseMessage],
+        cacheable: bool,
+        embedding: Optional[List[float]],
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Condense, retrieve and stream the answer for a question.
+
+        Yields:
+            ("token", text) for each generated chunk, then ("sources", sources)
+        """
+        # Read the prompt and chain once, so a prompt reload mid-answer
+        # cannot pair the new prompt with the old chain
+        answer_chain = self.engine.answer_chain
+        chain = answer_chain.conversation_chain
+        async with ask_limiter:
+            standalone_question = question
+            if chat_history:
+                condensed = await chain.question_generator.ainvoke(
+                    {
+                        "question": question,
+                        "chat_history": get_buffer_string(chat_history),
+                    },
+                    config=self.run_config,
+                )
+                standalone_question = condensed["text"]
+            docs = await chain.retriever.ainvoke(
+                standalone_question, config=self.run_config
+            )
+
+            prompt = answer_chain.qa_prompt.format_prompt(
+                context="\n\n".join(doc.page_content for doc in docs),
+                question=standalone_question,
+            )
+
+            answer_parts = []
+            async for chunk in self.engine.llm.astream(prompt, config=self.run_config):
+                token = chunk.content if isinstance(chunk.content, str) else ""
+                if token:
+                    answer_parts.append(token)
+                    yield "token", token
+
+        sources = list(
+            {doc.metadata["source"] for doc in docs if "source" in doc.metadata}
+        )
+        if cacheable:
+            answer = AgentAnswer("".join(answer_parts), sources)
+            self._cache_store(question, answer, embedding)
+
+        yield "sources", sources
 
     def reset_conversation(self):
         """Reset the conversation history."""
@@ -0,0 +1,192 @@
+"""
+Per-personality cache of answers to frequently asked questions.
+
+Answers are keyed by the normalized question text and, when a similarity
+threshold is configured, also matched by cosine similarity of the question
+embedding. Entries expire after a TTL, the cache is bounded in size, and it
+is cleared whenever the personality's index or prompt fingerprint changes.
+
+Question embeddings are kept as rows of one NumPy matrix, so a semantic
+lookup scores every entry with a single matrix-vector product.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Embedding matrix rows allocated at first, doubled when they run out
+_INITIAL_ROWS = 64
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for cache lookups: case, whitespace and end punctuation."""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.。？！")
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    return array / (np.linalg.norm(array) or 1.0)
+
+
+class AnswerCache:
+    """Thread-safe LRU answer cache with TTL and optional semantic matching."""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        similarity_threshold: float = 0.0,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.fingerprint: Optional[str] = None
+        # Entries of (answer, sources, created, embedding row or None)
+        self._entries: "OrderedDict[str, Tuple[str, List[str], float, Optional[int]]]" = (
+            OrderedDict()
+        )
+        # Unit question embeddings; free rows are zero and never match
+        self._vectors: Optional[np.ndarray] = None
+        self._free_rows: List[int] = []
+        self._row_keys: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def uses_embeddings(self) -> bool:
+        """Whether lookups also match by embedding similarity."""
+        return self.similarity_threshold > 0
+
+    def validate(self, fingerprint: str):
+        """Clear the cache if the index or prompt fingerprint has changed."""
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                if self._entries:
+                    print("Index or prompt changed; clearing answer cache")
+                self._clear()
+                self.fingerprint = fingerprint
+
+    def get(
+        self, question: str, embedding: Optional[List[float]] = None
+    ) -> Optional[Tuple[str, List[str]]]:
+        """
+        Look up a cached answer.
+
+        Args:
+            question: The question text
+            embedding: Optional question embedding for semantic matching
+
+        Returns:
+            Tuple of (answer_text, sources), or None on a miss
+        """
+        key = normalize_question(question)
+        unit = self._unit_embedding(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+
+            match = key if key in self._entries else None
+            if match is None and unit is not None:
+                match = self._most_similar(unit)
+
+            if match is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(match)
+            self.hits += 1
+            answer, sources, _, _ = self._entries[match]
+            return answer, list(sources)
+
+    def put(
+        self,
+        question: str,
+        answer: str,
+        sources: List[str],
+        embedding: Optional[List[float]] = None,
+    ):
+        """Store an answer, evicting the least recently used entry if full."""
+        key = normalize_question(question)
+        unit = self._unit_embedding(embedding)
+        with self._lock:
+            self._remove(key)
+            # Evict first, so the freed embedding row can be reused
+            while self.max_entries > 0 and len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            row = self._store_vector(unit) if unit is not None else None
+            if row is not None:
+                self._row_keys[row] = key
+            self._entries[key] = (answer, list(sources), time.monotonic(), row)
+
+    def _unit_embedding(self, embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+        """Normalize an embedding for semantic matching, if it is used."""
+        if embedding is None or not self.uses_embeddings:
+            return None
+        return _unit(embedding)
+
+    def _store_vector(self, vector: np.ndarray) -> Optional[int]:
+        """Write a unit embedding into a free matrix row. Caller holds the lock."""
+        if self._vectors is None:
+            self._vectors = np.zeros((_INITIAL_ROWS, len(vector)), dtype=np.float32)
+            self._free_rows = list(range(_INITIAL_ROWS - 1, -1, -1))
+        elif len(vector) != self._vectors.shape[1]:
+            return None
+        if not self._free_rows:
+            rows = len(self._vectors)
+            self._vectors = np.concatenate(
+                [self._vectors, np.zeros_like(self._vectors)]
+            )
+            self._free_rows = list(range(2 * rows - 1, rows - 1, -1))
+        row = self._free_rows.pop()
+        self._vectors[row] = vector
+        return row
+
+    def _remove(self, key: str):
+        """Drop an entry and free its embedding row. Caller holds the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[3] is not None:
+            self._vectors[entry[3]] = 0
+            self._free_rows.append(entry[3])
+            del self._row_keys[entry[3]]
+
+    def _most_similar(self, unit_embedding: np.ndarray) -> Optional[str]:
+        """Find the entry most similar to the embedding above the threshold. Caller holds the lock."""
+        if self._vectors is None or len(unit_embedding) != self._vectors.shape[1]:
+            return None
+        scores = self._vectors @ unit_embedding
+        best_row = int(np.argmax(scores))
+        if scores[best_row] < self.similarity_threshold:
+            return None
+        return self._row_keys.get(best_row)
+
+    def _evict_expired(self, now: float):
+        """Drop entries older than the TTL. Caller holds the lock."""
+        if self.ttl_seconds <= 0:
+            return
+        expired = [
+            key
+            for key, (_, _, created, _) in self._entries.items()
+            if now - created > self.ttl_seconds
+        ]
+        for key in expired:
+            self._remove(key)
+
+    def _clear(self):
+        """Drop every entry. Caller holds the lock."""
+        self._entries.clear()
+        self._vectors = None
+        self._free_rows = []
+        self._row_keys.clear()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the current size and hit and miss counters."""
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,198 @@
+"""
+Process-wide HTTP clients for the OpenAI and Anthropic APIs.
+
+Every engine, session and ingestion run goes through one pooled sync and
+one pooled async HTTP client per provider, so connections and TLS sessions
+are reused across personalities and users instead of each model object
+opening its own pool. Pool sizes, keep-alive and timeouts come from the
+HTTP_* settings. Calls made while answering questions also go through the
+provider's upstream client (see src.services.upstream).
+"""
+import sys
+import threading
+from functools import cached_property
+from types import ModuleType
+from typing import Any, AsyncIterator, Dict, List, Tuple
+import anthropic
+import openai
+from langchain_anthropic import ChatAnthropic
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_openai import OpenAIEmbeddings
+
+from src.config import settings
+from src.services.embedding_cache import query_embedding_cache
+from src.services.upstream import anthropic_upstream, openai_upstream
+
+# Default HTTP client classes of each SDK, as (sync, async)
+_CLIENT_CLASSES = {
+    "anthropic": (anthropic.DefaultHttpxClient, anthropic.DefaultAsyncHttpxClient),
+    "openai": (openai.DefaultHttpxClient, openai.DefaultAsyncHttpxClient),
+}
+
+_http_clients: Dict[Tuple[str, bool], Any] = {}
+_chat_models: Dict[Tuple[str, float, int], ChatAnthropic] = {}
+_lock = threading.Lock()
+
+
+def _httpx_module(client_class: type) -> ModuleType:
+    """Find the httpx package an SDK client class is built on."""
+    for base in client_class.__mro__:
+        if base.__name__ in ("Client", "AsyncClient") and base.__module__.startswith(
+            "httpx"
+        ):
+            return sys.modules[base.__module__.split(".")[0]]
+    raise TypeError(f"{client_class!r} is not an httpx client")
+
+
+def _create_http_client(client_class: type) -> Any:
+    """Create an SDK HTTP client with the configured pool limits and timeouts."""
+    httpx = _httpx_module(client_class)
+    return client_class(
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            settings.HTTP_TIMEOUT_SECONDS,
+            connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+        ),
+    )
+
+
+def get_http_client(provider: str, is_async: bool = False) -> Any:
+    """
+    Get the shared HTTP client for a provider, creating it on first use.
+
+    Args:
+        provider: "anthropic" or "openai"
+        is_async: Whether to return the asynchronous client
+
+    Returns:
+        The provider SDK's pooled httpx client
+    """
+    key = (provider, is_async)
+    with _lock:
+        client = _http_clients.get(key)
+        if client is None:
+            client = _create_http_client(_CLIENT_CLASSES[provider][is_async])
+            _http_clients[key] = client
+        return client
+
+
+class PooledChatAnthropic(ChatAnthropic):
+    """
+    ChatAnthropic on the shared connection pools.
+
+    Calls go through the Anthropic upstream client for concurrency limits,
+    retries and circuit breaking, so the SDK's own retries are disabled.
+    """
+
+    @cached_property
+    def _client(self) -> anthropic.Client:
+        return anthropic.Client(
+            **self._client_params, http_client=get_http_client("anthropic")
+        )
+
+    @cached_property
+    def _async_client(self) -> anthropic.AsyncClient:
+        return anthropic.AsyncClient(
+            **self._client_params,
+            http_client=get_http_client("anthropic", is_async=True),
+        )
+
+    def _generate(self, *args: Any, **kwargs: Any) -> ChatResult:
+        parent = super(PooledChatAnthropic, self)
+        return anthropic_upstream.call_sync(lambda: parent._generate(*args, **kwargs))
+
+    async def _agenerate(self, *args: Any, **kwargs: Any) -> ChatResult:
+        parent = super(PooledChatAnthropic, self)
+        return await anthropic_upstream.call(lambda: parent._agenerate(*args, **kwargs))
+
+    async def _astream(
+        self, *args: Any, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        parent = super(PooledChatAnthropic, self)
+        async for chunk in anthropic_upstream.stream(
+            lambda: parent._astream(*args, **kwargs)
+        ):
+            yield chunk
+
+
+class PooledOpenAIEmbeddings(OpenAIEmbeddings):
+    """
+    OpenAIEmbeddings on the shared connection pools.
+
+    Query embeddings, made while answering questions, are served from the
+    process-wide query embedding cache when possible and otherwise go
+    through the OpenAI upstream client. Document embeddings are only made
+    by ingestion, which batches and retries them itself.
+    """
+
+    def embed_query(self, text: str) -> List[float]:
+        embedding = query_embedding_cache.get(self.model, text)
+        if embedding is None:
+            parent = super(PooledOpenAIEmbeddings, self)
+            embedding = openai_upstream.call_sync(lambda: parent.embed_query(text))
+            query_embedding_cache.put(self.model, text, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        embedding = query_embedding_cache.get(self.model, text)
+        if embedding is None:
+            parent = super(PooledOpenAIEmbeddings, self)
+            embedding = await openai_upstream.call(lambda: parent.aembed_query(text))
+            query_embedding_cache.put(self.model, text, embedding)
+        return embedding
+
+
+def get_chat_model(model: str, temperature: float, max_tokens: int) -> ChatAnthropic:
+    """
+    Get the process-wide chat model for a model configuration.
+
+    Args:
+        model: The Anthropic model name
+        temperature: Sampling temperature
+        max_tokens: Maximum tokens to generate
+
+    Returns:
+        A ChatAnthropic shared by every caller with the same configuration
+    """
+    key = (model, temperature, max_tokens)
+    with _lock:
+        chat_model = _chat_models.get(key)
+        if chat_model is None:
+            chat_model = PooledChatAnthropic(
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                anthropic_api_key=settings.ANTHROPIC_API_KEY,
+                default_request_timeout=settings.HTTP_TIMEOUT_SECONDS,
+                max_retries=0,
+            )
+            _chat_models[key] = chat_model
+        return chat_model
+
+
+def create_openai_embeddings() -> OpenAIEmbeddings:
+    """Create an OpenAI embeddings client that uses the shared connection pools."""
+    return PooledOpenAIEmbeddings(
+        model=settings.EMBEDDING_MODEL_NAME,
+        openai_api_key=settings.OPENAI_API_KEY,
+        http_client=get_http_client("openai"),
+        http_async_client=get_http_client("openai", is_async=True),
+        request_timeout=settings.HTTP_TIMEOUT_SECONDS,
+        max_retries=0,
+    )
+
+
+async def close_http_clients():
+    """Close the shared HTTP clients, releasing their pooled connections."""
+    with _lock:
+        clients = list(_http_clients.items())
+        _http_clients.clear()
+    for (_, is_async), client in clients:
+        if is_async:
+            await client.aclose()
+        else:
+            client.close()
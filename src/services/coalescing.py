@@ -0,0 +1,168 @@
+"""
+Single-flight coalescing of identical in-flight questions.
+
+When many users ask a personality the same question at the same moment,
+only the first request runs retrieval and generation; the others await the
+same result. Streaming requests subscribe to the same event stream and
+receive every event from the beginning, including ones produced before they
+joined. A flight ends when its generation finishes, so later requests start
+a fresh one (or hit the answer cache).
+
+The generation runs in its own task, so a caller that disconnects does not
+cancel it for the others.
+"""
+import asyncio
+import hashlib
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+)
+from langchain_core.messages import BaseMessage, get_buffer_string
+
+from src.services.answer_cache import normalize_question
+
+
+def flight_key(
+    fingerprint: str, question: str, chat_history: List[BaseMessage]
+) -> Tuple[str, str, str]:
+    """
+    Build the key under which identical questions share a generation.
+
+    Args:
+        fingerprint: The engine's index and prompt fingerprint
+        question: The question text
+        chat_history: The chat history the answer depends on
+
+    Returns:
+        Tuple of (fingerprint, normalized question, history hash)
+    """
+    history_hash = hashlib.sha256(
+        get_buffer_string(chat_history).encode("utf-8")
+    ).hexdigest()
+    return fingerprint, normalize_question(question), history_hash
+
+
+class _Broadcast:
+    """Events of one streamed generation, replayed to every subscriber."""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls and streams with the same key."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self.started = 0
+        self.joined = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a call, or wait for the identical call already in flight.
+
+        Args:
+            key: The flight key
+            factory: Callable returning the awaitable to run if none is in flight
+
+        Returns:
+            The shared result; exceptions are raised to every caller
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.get_running_loop().create_task(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._forget(self._calls, key, task))
+        else:
+            self.joined += 1
+
+        # Shield so a disconnecting caller does not cancel the shared call
+        return await asyncio.shield(task)
+
+    async def stream(
+        self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]
+    ) -> AsyncIterator[Any]:
+        """
+        Subscribe to a stream, or to the identical stream already in flight.
+
+        Args:
+            key: The flight key
+            factory: Callable returning the async iterator to run if none is in flight
+
+        Yields:
+            Every event of the shared stream, from the first one
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.started += 1
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            task = asyncio.get_running_loop().create_task(
+                self._produce(key, broadcast, factory)
+            )
+            task.add_done_callback(lambda _: self._forget(self._streams, key, broadcast))
+        else:
+            self.joined += 1
+
+        index = 0
+        while True:
+            async with broadcast.changed:
+                await broadcast.changed.wait_for(
+                    lambda: index < len(broadcast.events) or broadcast.done
+                )
+                events = broadcast.events[index:]
+                done = broadcast.done
+
+            for event in events:
+                yield event
+            index += len(events)
+
+            if done and index == len(broadcast.events):
+                if broadcast.error is not None:
+                    raise broadcast.error
+                return
+
+    async def _produce(
+        self,
+        key: Hashable,
+        broadcast: _Broadcast,
+        factory: Callable[[], AsyncIterator[Any]],
+    ):
+        """Run the stream to completion and publish its events."""
+        try:
+            async for event in factory():
+                async with broadcast.changed:
+                    broadcast.events.append(event)
+                    broadcast.changed.notify_all()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            async with broadcast.changed:
+                broadcast.done = True
+                broadcast.changed.notify_all()
+
+    @staticmethod
+    def _forget(flights: Dict[Hashable, Any], key: Hashable, flight: Any):
+        """Remove a finished flight unless a newer one has replaced it."""
+        if flights.get(key) is flight:
+            del flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Get the number of started and joined flights and those in flight now."""
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "started": self.started,
+            "joined": self.joined,
+        }
@@ -0,0 +1,126 @@
+"""
+Question condensing for follow-up questions.
+
+ConversationalRetrievalChain rewrites every follow-up question into a
+standalone question with an extra LLM call. StandaloneQuestionChain wraps
+that step and passes questions through unchanged when a cheap heuristic
+says they already stand on their own, saving a full LLM round trip.
+"""
+import re
+from typing import Any, Dict, List, Optional
+from langchain.chains.base import Chain
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForChainRun,
+    CallbackManagerForChainRun,
+)
+
+from src.services.metrics import CONDENSE_TAG, run_personality, timed_stage
+
+# Words that usually refer back to something earlier in the conversation
+_REFERENCE_WORDS = set(
+    "it its it's this that these those they them their theirs he him his she "
+    "her hers there above previous earlier former latter same such else more "
+    "again also another other one ones".split()
+)
+
+# Openings that continue the previous turn
+_CONTINUATIONS = tuple(
+    [
+        "and ",
+        "but ",
+        "so ",
+        "or ",
+        "what about",
+        "how about",
+        "why",
+        "then",
+        "also",
+        "tell me more",
+        "go on",
+        "elaborate",
+        "explain",
+        "can you expand",
+    ]
+)
+
+# Shorter questions are too terse to judge and are always rewritten
+_MIN_STANDALONE_WORDS = 5
+
+
+def is_standalone_question(question: str) -> bool:
+    """
+    Guess whether a question can be understood without the chat history.
+
+    Conservative: anything that is short, starts like a continuation, uses a
+    referring word, or is not written in Latin script is treated as needing
+    a rewrite.
+
+    Args:
+        question: The question text
+
+    Returns:
+        True if the question can skip the condensing step
+    """
+    text = question.strip().lower()
+    if not text or not text.isascii():
+        return False
+
+    words = re.findall(r"[a-z']+", text)
+    if len(words) < _MIN_STANDALONE_WORDS:
+        return False
+    if text.startswith(_CONTINUATIONS):
+        return False
+    return not any(word in _REFERENCE_WORDS for word in words)
+
+
+class StandaloneQuestionChain(Chain):
+    """Condense-question step that skips the LLM for standalone questions."""
+
+    condense_chain: Chain
+    use_heuristic: bool = True
+
+    @property
+    def input_keys(self) -> List[str]:
+        return ["question", "chat_history"]
+
+    @property
+    def output_keys(self) -> List[str]:
+        return ["text"]
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, str]:
+        question = inputs["question"]
+        if self.use_heuristic and is_standalone_question(question):
+            return {"text": question}
+
+        callbacks = run_manager.get_child() if run_manager else None
+        with timed_stage("condense", run_personality(run_manager)):
+            text = self.condense_chain.run(
+                question=question,
+                chat_history=inputs["chat_history"],
+                callbacks=callbacks,
+                tags=[CONDENSE_TAG],
+            )
+        return {"text": text}
+
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, str]:
+        question = inputs["question"]
+        if self.use_heuristic and is_standalone_question(question):
+            return {"text": question}
+
+        callbacks = run_manager.get_child() if run_manager else None
+        with timed_stage("condense", run_personality(run_manager)):
+            text = await self.condense_chain.arun(
+                question=question,
+                chat_history=inputs["chat_history"],
+                callbacks=callbacks,
+                tags=[CONDENSE_TAG],
+            )
+        return {"text": text}
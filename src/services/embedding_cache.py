@@ -0,0 +1,79 @@
+"""
+Process-wide LRU cache of query embeddings.
+
+Every question is embedded before retrieval, and the same question text is
+often embedded again seconds later, by another user or for another
+personality. The cache is keyed by embedding model and normalized question
+text and shared by every engine, so a repeated question costs no embeddings
+round trip. Vectors are stored as float32 arrays to keep entries small.
+Hits and misses are counted in `avatar_query_embedding_cache_total`.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from src.config import settings
+from src.services.answer_cache import normalize_question
+from src.services.metrics import record_embedding_cache
+
+
+class QueryEmbeddingCache:
+    """Thread-safe bounded LRU map of (model, normalized text) to embedding."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """
+        Look up a query embedding and mark it as recently used.
+
+        Args:
+            model: The embedding model name
+            text: The query text
+
+        Returns:
+            The embedding, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        key = (model, normalize_question(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+        record_embedding_cache(vector is not None)
+        return None if vector is None else vector.tolist()
+
+    def put(self, model: str, text: str, embedding: List[float]):
+        """Store a query embedding, evicting the least recently used beyond the limit."""
+        if not self.enabled:
+            return
+
+        key = (model, normalize_question(text))
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the current size; hits and misses are counted in the metrics."""
+        with self._lock:
+            return {"size": len(self._entries), "max_entries": self.max_entries}
+
+
+# Shared by every engine and embeddings client in the process
+query_embedding_cache = QueryEmbeddingCache(settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES)
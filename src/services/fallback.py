@@ -0,0 +1,80 @@
+"""
+Degraded answers for personalities without a knowledge base.
+
+When no vector database is available there is nothing to retrieve, and
+sending an empty context through the full QA prompt pays for a complete
+generation that can only say "I don't know". FallbackResponder answers
+instead with the personality's precomputed canned response, or, with
+FALLBACK_MODE=generate, with a short low-token generation in the question's
+language whose answers are cached per question.
+"""
+from typing import Optional
+
+from src.config import settings
+from src.services.answer_cache import AnswerCache
+from src.services.clients import get_chat_model
+from src.services.metrics import FALLBACK_TAG, run_config
+from src.services.personality_manager import get_personality_class
+
+# Source reported for degraded answers
+FALLBACK_SOURCE = "No knowledge base available"
+
+
+class FallbackResponder:
+    """Cheap degraded answers for one personality."""
+
+    def __init__(self, personality_id: Optional[str] = None):
+        personality_class = get_personality_class(personality_id)
+        self.response = personality_class.get_fallback_response()
+        self.generate = settings.FALLBACK_MODE == "generate"
+        self.llm = None
+        self.prompt = None
+        self.cache = None
+        self.run_config = run_config(personality_id, FALLBACK_TAG)
+        if self.generate:
+            self.llm = get_chat_model(
+                settings.ANTHROPIC_MODEL_NAME,
+                temperature=0,
+                max_tokens=settings.FALLBACK_MAX_TOKENS,
+            )
+            self.prompt = personality_class.get_fallback_prompt_template()
+            self.cache = AnswerCache(
+                max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+            )
+
+    def answer(self, question: str) -> str:
+        """
+        Get the degraded answer to a question.
+
+        Args:
+            question: The question text
+
+        Returns:
+            The canned response, or a cached or newly generated short answer
+        """
+        if not self.generate:
+            return self.response
+
+        hit = self.cache.get(question)
+        if hit is not None:
+            return hit[0]
+        text = self.llm.invoke(
+            self.prompt.format_prompt(question=question), config=self.run_config
+        ).content
+        self.cache.put(question, text, [FALLBACK_SOURCE])
+        return text
+
+    async def aanswer(self, question: str) -> str:
+        """Asynchronous version of answer."""
+        if not self.generate:
+            return self.response
+
+        hit = self.cache.get(question)
+        if hit is not None:
+            return hit[0]
+        message = await self.llm.ainvoke(
+            self.prompt.format_prompt(question=question), config=self.run_config
+        )
+        self.cache.put(question, message.content, [FALLBACK_SOURCE])
+        return message.content
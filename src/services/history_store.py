@@ -0,0 +1,489 @@
+"""
+Pluggable storage for conversation history.
+
+Session memory keeps its messages in a HistoryStore instead of inside the
+process, so several uvicorn workers or replicas can serve the same
+conversation. Backends:
+
+- "memory": process-local dictionary (single worker, the default)
+- "sqlite": a SQLite file shared by workers on the same host
+- "redis": a Redis server shared by every replica
+
+External backends are wrapped in a WriteBehindHistoryStore so appends are
+queued and flushed in batches by a background thread; /ask never waits for
+a write round trip.
+
+Besides its messages, a session may have a rolling summary of older turns
+(MEMORY_MODE=summary). `compact` replaces the oldest messages with a new
+summary in one store operation, so every worker sees either the old
+messages or the new summary, and a turn appended meanwhile is never lost.
+"""
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+
+from src.config import settings
+
+
+class HistoryStore(ABC):
+    """Interface for conversation history backends."""
+
+    @abstractmethod
+    def load(self, session_key: str) -> List[BaseMessage]:
+        """Load every message of a session, oldest first."""
+
+    @abstractmethod
+    def append(self, session_key: str, messages: Sequence[BaseMessage]):
+        """Append messages to a session."""
+
+    @abstractmethod
+    def clear(self, session_key: str):
+        """Delete a session's messages and summary."""
+
+    @abstractmethod
+    def load_summary(self, session_key: str) -> str:
+        """Load a session's summary of older turns, or an empty string."""
+
+    @abstractmethod
+    def compact(
+        self, session_key: str, summarized: Sequence[BaseMessage], summary: str
+    ) -> bool:
+        """
+        Replace a session's oldest messages with a summary, atomically.
+
+        Args:
+            session_key: The session
+            summarized: The oldest messages of the session, now summarized
+            summary: The summary replacing them and any previous summary
+
+        Returns:
+            True if the session still started with `summarized` and was
+            compacted; False if its history changed meanwhile
+        """
+
+    def load_with_summary(self, session_key: str) -> Tuple[str, List[BaseMessage]]:
+        """Load a session's summary and messages."""
+        return self.load_summary(session_key), self.load(session_key)
+
+    def close(self):
+        """Release resources held by the store."""
+
+
+class InMemoryHistoryStore(HistoryStore):
+    """Process-local history store."""
+
+    def __init__(self):
+        self._sessions: Dict[str, List[BaseMessage]] = defaultdict(list)
+        self._summaries: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_key: str) -> List[BaseMessage]:
+        with self._lock:
+            return list(self._sessions.get(session_key, []))
+
+    def append(self, session_key: str, messages: Sequence[BaseMessage]):
+        with self._lock:
+            self._sessions[session_key].extend(messages)
+
+    def clear(self, session_key: str):
+        with self._lock:
+            self._sessions.pop(session_key, None)
+            self._summaries.pop(session_key, None)
+
+    def load_summary(self, session_key: str) -> str:
+        with self._lock:
+            return self._summaries.get(session_key, "")
+
+    def load_with_summary(self, session_key: str) -> Tuple[str, List[BaseMessage]]:
+        with self._lock:
+            return (
+                self._summaries.get(session_key, ""),
+                list(self._sessions.get(session_key, [])),
+            )
+
+    def compact(
+        self, session_key: str, summarized: Sequence[BaseMessage], summary: str
+    ) -> bool:
+        with self._lock:
+            messages = self._sessions.get(session_key, [])
+            if messages[: len(summarized)] != list(summarized):
+                return False
+            del messages[: len(summarized)]
+            self._summaries[session_key] = summary
+            return True
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """History store backed by a SQLite file in WAL mode."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "session_key TEXT NOT NULL, "
+                "message TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS messages_session_key "
+                "ON messages (session_key, id)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "session_key TEXT PRIMARY KEY, "
+                "summary TEXT NOT NULL)"
+            )
+
+    def load(self, session_key: str) -> List[BaseMessage]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message FROM messages WHERE session_key = ? ORDER BY id",
+                (session_key,),
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def append(self, session_key: str, messages: Sequence[BaseMessage]):
+        rows = [
+            (session_key, json.dumps(message))
+            for message in messages_to_dict(list(messages))
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (session_key, message) VALUES (?, ?)", rows
+            )
+
+    def clear(self, session_key: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM messages WHERE session_key = ?", (session_key,)
+            )
+            self._conn.execute(
+                "DELETE FROM summaries WHERE session_key = ?", (session_key,)
+            )
+
+    def load_summary(self, session_key: str) -> str:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary FROM summaries WHERE session_key = ?", (session_key,)
+            ).fetchone()
+        return row[0] if row else ""
+
+    def compact(
+        self, session_key: str, summarized: Sequence[BaseMessage], summary: str
+    ) -> bool:
+        if not summarized:
+            return False
+        with self._lock, self._conn:
+            # Lock the database before reading, so no other worker can append
+            # or compact between the check and the delete
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT id, message FROM messages WHERE session_key = ? "
+                "ORDER BY id LIMIT ?",
+                (session_key, len(summarized)),
+            ).fetchall()
+            stored = messages_from_dict([json.loads(row[1]) for row in rows])
+            if stored != list(summarized):
+                return False
+            self._conn.execute(
+                "DELETE FROM messages WHERE session_key = ? AND id <= ?",
+                (session_key, rows[-1][0]),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (session_key, summary) VALUES (?, ?)",
+                (session_key, summary),
+            )
+            return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisHistoryStore(HistoryStore):
+    """
+    History store backed by Redis lists.
+
+    Accepts any redis-py compatible client, so tests can pass a local fake
+    such as `fakeredis.FakeRedis()`. Sessions expire after the idle TTL.
+    """
+
+    def __init__(self, client: Any, ttl_seconds: int = 0, prefix: str = "history:"):
+        self._client = client
+        self._ttl_seconds = ttl_seconds
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl_seconds: int = 0) -> "RedisHistoryStore":
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(
+                "SESSION_BACKEND=redis requires the redis package: pip install redis"
+            ) from e
+        return cls(redis.Redis.from_url(url), ttl_seconds=ttl_seconds)
+
+    def _key(self, session_key: str) -> str:
+        return f"{self._prefix}{session_key}"
+
+    def _summary_key(self, session_key: str) -> str:
+        return f"{self._prefix}{session_key}:summary"
+
+    def load(self, session_key: str) -> List[BaseMessage]:
+        raw = self._client.lrange(self._key(session_key), 0, -1)
+        return messages_from_dict([json.loads(item) for item in raw])
+
+    def load_summary(self, session_key: str) -> str:
+        summary = self._client.get(self._summary_key(session_key))
+        return summary.decode("utf-8") if isinstance(summary, bytes) else summary or ""
+
+    def load_with_summary(self, session_key: str) -> Tuple[str, List[BaseMessage]]:
+        # One round trip for both
+        pipeline = self._client.pipeline()
+        pipeline.get(self._summary_key(session_key))
+        pipeline.lrange(self._key(session_key), 0, -1)
+        summary, raw = pipeline.execute()
+        if isinstance(summary, bytes):
+            summary = summary.decode("utf-8")
+        return summary or "", messages_from_dict([json.loads(item) for item in raw])
+
+    def append(self, session_key: str, messages: Sequence[BaseMessage]):
+        key = self._key(session_key)
+        pipeline = self._client.pipeline()
+        pipeline.rpush(
+            key, *[json.dumps(message) for message in messages_to_dict(list(messages))]
+        )
+        if self._ttl_seconds > 0:
+            pipeline.expire(key, self._ttl_seconds)
+            pipeline.expire(self._summary_key(session_key), self._ttl_seconds)
+        pipeline.execute()
+
+    def clear(self, session_key: str):
+        self._client.delete(self._key(session_key), self._summary_key(session_key))
+
+    def compact(
+        self, session_key: str, summarized: Sequence[BaseMessage], summary: str
+    ) -> bool:
+        from redis.exceptions import WatchError
+
+        if not summarized:
+            return False
+        key = self._key(session_key)
+        with self._client.pipeline() as pipeline:
+            try:
+                # The transaction fails if another worker appends or
+                # compacts between the check and the trim
+                pipeline.watch(key)
+                raw = pipeline.lrange(key, 0, len(summarized) - 1)
+                stored = messages_from_dict([json.loads(item) for item in raw])
+                if stored != list(summarized):
+                    return False
+                pipeline.multi()
+                pipeline.ltrim(key, len(summarized), -1)
+                pipeline.set(
+                    self._summary_key(session_key),
+                    summary,
+                    ex=self._ttl_seconds if self._ttl_seconds > 0 else None,
+                )
+                pipeline.execute()
+                return True
+            except WatchError:
+                return False
+
+    def close(self):
+        self._client.close()
+
+
+class WriteBehindHistoryStore(HistoryStore):
+    """
+    Queue writes to another store and flush them in batches from a thread.
+
+    Reads merge the backing store with writes that have not been flushed
+    yet, so a session always sees its own latest turns.
+    """
+
+    def __init__(self, store: HistoryStore, flush_interval_seconds: float):
+        self._store = store
+        self._flush_interval_seconds = flush_interval_seconds
+        # Ordered (session_key, op, messages) operations not yet flushed
+        self._pending: List[Tuple[str, str, List[BaseMessage]]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="history-writer", daemon=True
+        )
+        self._thread.start()
+
+    def load(self, session_key: str) -> List[BaseMessage]:
+        return self.load_with_summary(session_key)[1]
+
+    def load_summary(self, session_key: str) -> str:
+        return self.load_with_summary(session_key)[0]
+
+    def load_with_summary(self, session_key: str) -> Tuple[str, List[BaseMessage]]:
+        # Hold the flush lock so a batch is never half in the store and half pending
+        with self._flush_lock:
+            summary, messages = self._store.load_with_summary(session_key)
+            with self._lock:
+                pending = [op for op in self._pending if op[0] == session_key]
+        for _, op, op_messages in pending:
+            if op == "clear":
+                summary, messages = "", []
+            else:
+                messages.extend(op_messages)
+        return summary, messages
+
+    def compact(
+        self, session_key: str, summarized: Sequence[BaseMessage], summary: str
+    ) -> bool:
+        # Compaction runs in the background already, so write it through:
+        # flush queued operations first to keep them in order
+        with self._flush_lock:
+            if not self._flush_pending():
+                return False
+            return self._store.compact(session_key, summarized, summary)
+
+    def append(self, session_key: str, messages: Sequence[BaseMessage]):
+        self._enqueue(session_key, "append", list(messages))
+
+    def clear(self, session_key: str):
+        self._enqueue(session_key, "clear", [])
+
+    def _enqueue(self, session_key: str, op: str, messages: List[BaseMessage]):
+        with self._lock:
+            self._pending.append((session_key, op, messages))
+        self._wakeup.set()
+
+    def flush(self):
+        """Write every queued operation to the backing store, in order."""
+        with self._flush_lock:
+            self._flush_pending()
+
+    def _flush_pending(self) -> bool:
+        """
+        Write the queued operations; the caller holds the flush lock.
+
+        Returns:
+            False if the write failed and the operations are still queued
+        """
+        with self._lock:
+            batch = list(self._pending)
+        if not batch:
+            return True
+
+        # Merge consecutive appends to the same session into one write
+        merged: List[Tuple[str, str, List[BaseMessage]]] = []
+        for session_key, op, messages in batch:
+            if merged and op == "append" and merged[-1][:2] == (session_key, op):
+                merged[-1][2].extend(messages)
+            else:
+                merged.append((session_key, op, list(messages)))
+
+        try:
+            for session_key, op, messages in merged:
+                if op == "clear":
+                    self._store.clear(session_key)
+                else:
+                    self._store.append(session_key, messages)
+        except Exception as e:
+            # Keep the batch queued and retry on the next flush
+            print(f"Error writing conversation history: {e}")
+            return False
+
+        with self._lock:
+            del self._pending[: len(batch)]
+        return True
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Give concurrent turns a moment to join the same batch
+            time.sleep(self._flush_interval_seconds)
+            self.flush()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        self._store.close()
+
+
+class StoredChatMessageHistory(BaseChatMessageHistory):
+    """LangChain chat history that reads and writes a HistoryStore session."""
+
+    def __init__(self, store: HistoryStore, session_key: str):
+        self.store = store
+        self.session_key = session_key
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self.store.load(self.session_key)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.store.append(self.session_key, messages)
+
+    def clear(self) -> None:
+        self.store.clear(self.session_key)
+
+    def load_with_summary(self) -> Tuple[str, List[BaseMessage]]:
+        """Load the session's summary of older turns and its messages."""
+        return self.store.load_with_summary(self.session_key)
+
+    def compact(self, summarized: Sequence[BaseMessage], summary: str) -> bool:
+        """Replace the session's oldest messages with a summary, atomically."""
+        return self.store.compact(self.session_key, summarized, summary)
+
+
+_history_store: Optional[HistoryStore] = None
+_history_store_lock = threading.Lock()
+
+
+def create_history_store() -> HistoryStore:
+    """Create the history store selected by SESSION_BACKEND."""
+    backend = settings.SESSION_BACKEND
+    flush_interval = settings.SESSION_WRITE_FLUSH_INTERVAL_MS / 1000
+    if backend == "sqlite":
+        return WriteBehindHistoryStore(
+            SQLiteHistoryStore(settings.SESSION_SQLITE_PATH), flush_interval
+        )
+    if backend == "redis":
+        return WriteBehindHistoryStore(
+            RedisHistoryStore.from_url(
+                settings.REDIS_URL, ttl_seconds=settings.SESSION_TTL_SECONDS
+            ),
+            flush_interval,
+        )
+    if backend != "memory":
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    return InMemoryHistoryStore()
+
+
+def get_history_store() -> HistoryStore:
+    """Get the process-wide history store, creating it on first use."""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            _history_store = create_history_store()
+        return _history_store
+
+
+def close_history_store():
+    """Flush pending writes and close the process-wide history store."""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is not None:
+            _history_store.close()
+            _history_store = None
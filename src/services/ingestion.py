@@ -0,0 +1,471 @@
+"""
+PDF ingestion for personality vector databases.
+
+Loads a personality's PDFs, splits them into chunks and writes a Chroma
+store together with a manifest describing what was indexed, plus a NumPy
+export of the store for the in-process retrieval backend and a BM25 index
+for hybrid retrieval. Files and chunks
+are keyed by content hash so rebuilds only embed what changed. Used both by
+the retrieval engine, when no index exists yet, and by the offline
+`python -m src.build_index` command.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from typing import Any, Dict, List, Optional, Set, Tuple
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores import Chroma
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain.schema.document import Document
+from langchain_core.embeddings import Embeddings
+
+from src.config import settings
+from src.services.clients import create_openai_embeddings
+from src.services.lexical_index import export_lexical_index
+from src.services.upstream import RETRYABLE_OPENAI_ERRORS, retry_delay
+from src.services.vector_index import export_numpy_index
+
+# Name of the manifest written next to chroma.sqlite3
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_FORMAT_VERSION = 2
+
+# Chunking parameters; they are part of the index version
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def create_embeddings() -> Embeddings:
+    """
+    Create the embedding client used to build and query vector databases.
+
+    When EMBEDDING_CACHE_DIR is set, document embeddings are cached on disk
+    keyed by embedding model and chunk text hash. The cache is shared by
+    every personality and survives rebuilds, so identical text is only sent
+    to the API once.
+    """
+    embeddings = create_openai_embeddings()
+    if not settings.EMBEDDING_CACHE_DIR:
+        return embeddings
+
+    return CacheBackedEmbeddings.from_bytes_store(
+        embeddings,
+        LocalFileStore(settings.EMBEDDING_CACHE_DIR),
+        namespace=settings.EMBEDDING_MODEL_NAME,
+    )
+
+
+def list_pdfs() -> List[str]:
+    """List every PDF in the configured directory, sorted by path."""
+    if not os.path.isdir(settings.PDF_DIR):
+        return []
+
+    return sorted(
+        os.path.join(settings.PDF_DIR, filename)
+        for filename in os.listdir(settings.PDF_DIR)
+        if filename.endswith(".pdf")
+    )
+
+
+def get_source_pdfs(personality_id: Optional[str]) -> List[str]:
+    """
+    Get the PDF files indexed for a personality.
+
+    A personality uses its own `<personality_id>.pdf` when present and every
+    PDF in the directory otherwise. The general engine indexes no PDFs.
+
+    Args:
+        personality_id: The personality ID, or None for the general engine
+
+    Returns:
+        Sorted list of PDF paths
+    """
+    if not personality_id:
+        return []
+
+    pdf_path = os.path.join(settings.PDF_DIR, f"{personality_id}.pdf")
+    if os.path.exists(pdf_path):
+        return [pdf_path]
+    return list_pdfs()
+
+
+def load_pdf(pdf_path: str) -> List[Document]:
+    """Load the pages of one PDF file."""
+    loader = PyPDFLoader(pdf_path)
+    documents = loader.load()
+    print(f"Loaded {len(documents)} documents from {os.path.basename(pdf_path)}")
+    return documents
+
+
+def _minimal_document(personality_id: Optional[str]) -> Document:
+    """Create a minimal document describing a personality without PDFs."""
+    if personality_id:
+        # Get personality name from ID with title case formatting
+        personality_name = " ".join(
+            word.capitalize() for word in personality_id.split("-")
+        )
+        minimal_text = (
+            f"This is the {personality_name} agent. "
+            f"It specializes in providing advice and information related to {personality_id}. "
+            "Since no detailed information is available, responses will be limited."
+        )
+    else:
+        minimal_text = (
+            "This is a general AI assistant. "
+            "Since no detailed information is available, responses will be limited."
+        )
+
+    return Document(page_content=minimal_text, metadata={"source": "minimal_info.txt"})
+
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    """Split documents into overlapping chunks."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        separators=["\n\n", "\n", " ", ""],
+    )
+    return text_splitter.split_documents(documents)
+
+
+def hash_file(path: str) -> str:
+    """Compute the SHA-256 hash of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """Compute the SHA-256 hash of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(chunk: Document) -> str:
+    """
+    Compute a stable ID for a chunk from its source file, page and text.
+
+    Unchanged chunks keep their ID across rebuilds, so they are never
+    embedded again even when other parts of the same file change.
+    """
+    source = os.path.basename(str(chunk.metadata.get("source", "")))
+    page = chunk.metadata.get("page", "")
+    return hash_text(f"{source}\x00{page}\x00{chunk.page_content}")
+
+
+def compute_content_hash(file_hashes: Dict[str, str]) -> str:
+    """
+    Compute a hash of the indexed corpus and chunking parameters.
+
+    Args:
+        file_hashes: Mapping of PDF file name to content hash
+
+    Returns:
+        Hex digest identifying the corpus
+    """
+    digest = hashlib.sha256()
+    digest.update(f"chunks:{CHUNK_SIZE}:{CHUNK_OVERLAP}\n".encode("utf-8"))
+    for filename in sorted(file_hashes):
+        digest.update(f"{filename}:{file_hashes[filename]}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def read_manifest(vector_db_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the manifest of a vector database directory.
+
+    Args:
+        vector_db_path: The vector database directory
+
+    Returns:
+        The manifest, or None if it is missing or unreadable
+    """
+    manifest_path = os.path.join(vector_db_path, MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading manifest {manifest_path}: {e}")
+        return None
+
+
+def write_manifest(vector_db_path: str, manifest: Dict[str, Any]):
+    """Write the manifest of a vector database directory."""
+    manifest_path = os.path.join(vector_db_path, MANIFEST_FILENAME)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Embeddings that serve vectors computed ahead of time, falling back to a real client."""
+
+    def __init__(self, vectors: Dict[str, List[float]], fallback: Embeddings):
+        self.vectors = vectors
+        self.fallback = fallback
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        missing = [text for text in texts if text not in self.vectors]
+        if missing:
+            self.vectors.update(zip(missing, self.fallback.embed_documents(missing)))
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.fallback.embed_query(text)
+
+
+def embed_batch(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embed one batch of texts, backing off and retrying on rate limits.
+
+    Args:
+        embeddings: The embedding client
+        texts: The texts to embed
+
+    Returns:
+        One vector per text
+    """
+    for attempt in range(settings.EMBEDDING_MAX_RETRIES + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except RETRYABLE_OPENAI_ERRORS as e:
+            if attempt == settings.EMBEDDING_MAX_RETRIES:
+                raise
+            delay = retry_delay(e, attempt, base_seconds=1.0, max_seconds=60.0)
+            print(
+                f"Embedding batch failed ({e.__class__.__name__}); "
+                f"retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+class _IngestionRun:
+    """
+    One incremental build of a vector database.
+
+    PDFs are parsed in a process pool and split as each file arrives. New
+    chunks are embedded in batches on a thread pool while parsing continues,
+    then written to the store.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        existing_ids: Set[str],
+        previous_files: Dict[str, Any],
+    ):
+        self.embeddings = embeddings
+        self.existing_ids = existing_ids
+        self.previous_files = previous_files
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.desired_ids: Set[str] = set()
+        self.new_chunks: Dict[str, Document] = {}
+        self._pending: List[Document] = []
+        self._embed_futures: Dict[Future, List[str]] = {}
+        self._embed_pool = ThreadPoolExecutor(
+            max_workers=settings.EMBEDDING_CONCURRENCY
+        )
+
+    def add_sources(self, pdf_paths: List[str]) -> List[str]:
+        """
+        Index PDF files, skipping files unchanged since the previous build.
+
+        Args:
+            pdf_paths: The PDF files to index
+
+        Returns:
+            Paths of files that could not be loaded
+        """
+        to_parse = []
+        for pdf_path in pdf_paths:
+            filename = os.path.basename(pdf_path)
+            if filename in self.files:
+                continue
+            file_hash = hash_file(pdf_path)
+
+            # Unchanged file whose chunks are all still stored: skip parsing
+            previous = self.previous_files.get(filename)
+            if (
+                isinstance(previous, dict)
+                and previous.get("hash") == file_hash
+                and self.existing_ids.issuperset(previous.get("chunks", []))
+            ):
+                self.files[filename] = previous
+                self.desired_ids.update(previous["chunks"])
+                continue
+            to_parse.append((pdf_path, file_hash))
+
+        failed = []
+        for pdf_path, file_hash, pages in self._parse(to_parse):
+            if pages is None:
+                failed.append(pdf_path)
+                continue
+            chunk_ids = self.add_chunks(split_documents(pages), file_hash)
+            self.files[os.path.basename(pdf_path)] = {
+                "hash": file_hash,
+                "chunks": list(dict.fromkeys(chunk_ids)),
+            }
+        return failed
+
+    def _parse(self, to_parse: List[Tuple[str, str]]):
+        """Parse PDFs in a process pool, yielding (path, hash, pages) as each completes."""
+        if len(to_parse) <= 1 or settings.INGEST_WORKERS <= 1:
+            for pdf_path, file_hash in to_parse:
+                yield pdf_path, file_hash, _try_load_pdf(pdf_path)
+            return
+
+        workers = min(settings.INGEST_WORKERS, len(to_parse))
+        # Spawn rather than fork: builds may start from a threaded server process
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = {
+                pool.submit(_try_load_pdf, pdf_path): (pdf_path, file_hash)
+                for pdf_path, file_hash in to_parse
+            }
+            for future in as_completed(futures):
+                pdf_path, file_hash = futures[future]
+                yield pdf_path, file_hash, future.result()
+
+    def add_chunks(self, chunks: List[Document], file_hash: str = "") -> List[str]:
+        """Register chunks and queue the new ones for embedding. Returns their IDs."""
+        chunk_ids = []
+        for chunk in chunks:
+            cid = chunk_id(chunk)
+            chunk.metadata.update({"file_hash": file_hash, "chunk_hash": cid})
+            chunk_ids.append(cid)
+            self.desired_ids.add(cid)
+            if cid not in self.existing_ids and cid not in self.new_chunks:
+                self.new_chunks[cid] = chunk
+                self._pending.append(chunk)
+
+        while len(self._pending) >= settings.EMBEDDING_BATCH_SIZE:
+            self._submit_batch(self._pending[: settings.EMBEDDING_BATCH_SIZE])
+            self._pending = self._pending[settings.EMBEDDING_BATCH_SIZE :]
+        return chunk_ids
+
+    def _submit_batch(self, batch: List[Document]):
+        texts = [chunk.page_content for chunk in batch]
+        future = self._embed_pool.submit(embed_batch, self.embeddings, texts)
+        self._embed_futures[future] = texts
+
+    def write(self, vector_db_path: str, vector_db: Chroma):
+        """Finish embedding, delete stale chunks and add new ones to the store."""
+        if self._pending:
+            self._submit_batch(self._pending)
+            self._pending = []
+
+        vectors: Dict[str, List[float]] = {}
+        try:
+            for future in as_completed(self._embed_futures):
+                vectors.update(zip(self._embed_futures[future], future.result()))
+        finally:
+            self._embed_pool.shutdown(wait=False, cancel_futures=True)
+
+        stale_ids = self.existing_ids - self.desired_ids
+        if stale_ids:
+            vector_db.delete(ids=list(stale_ids))
+
+        if self.new_chunks:
+            writer = Chroma(
+                persist_directory=vector_db_path,
+                embedding_function=PrecomputedEmbeddings(vectors, self.embeddings),
+            )
+            ids = list(self.new_chunks)
+            chunks = list(self.new_chunks.values())
+            for start in range(0, len(ids), settings.EMBEDDING_BATCH_SIZE):
+                end = start + settings.EMBEDDING_BATCH_SIZE
+                writer.add_documents(chunks[start:end], ids=ids[start:end])
+        vector_db.persist()
+        return stale_ids
+
+
+def _try_load_pdf(pdf_path: str) -> Optional[List[Document]]:
+    """Load a PDF in a worker process, returning None if it cannot be read."""
+    try:
+        return load_pdf(pdf_path)
+    except Exception as e:
+        print(f"Error loading {pdf_path}: {e}")
+        return None
+
+
+def build_vector_db(
+    personality_id: Optional[str], vector_db_path: str, embeddings: Embeddings
+) -> Chroma:
+    """
+    Build or incrementally update the vector database and manifest for a personality.
+
+    Files whose content hash matches the previous manifest are not parsed
+    again. Changed files are parsed in parallel and re-split, and only chunks
+    with new IDs are embedded, in concurrent batches of EMBEDDING_BATCH_SIZE;
+    chunks that no longer exist are deleted from the store.
+
+    Args:
+        personality_id: The personality ID, or None for the general engine
+        vector_db_path: Directory holding the Chroma store
+        embeddings: The embedding client
+
+    Returns:
+        The persisted Chroma store
+    """
+    os.makedirs(vector_db_path, exist_ok=True)
+
+    vector_db = Chroma(persist_directory=vector_db_path, embedding_function=embeddings)
+    run = _IngestionRun(
+        embeddings,
+        existing_ids=set(vector_db.get(include=[])["ids"]),
+        previous_files=(read_manifest(vector_db_path) or {}).get("files", {}),
+    )
+
+    sources = get_source_pdfs(personality_id)
+    failed = run.add_sources(sources)
+    if personality_id and failed == sources and sources != list_pdfs():
+        # Same as a missing personality PDF: index every PDF instead
+        print(f"Warning: Personality-specific PDF could not be loaded: {failed[0]}")
+        run.add_sources([path for path in list_pdfs() if path not in failed])
+
+    if not run.desired_ids:
+        print("Warning: No PDFs were loaded. Creating minimal vector database.")
+        run.add_chunks(split_documents([_minimal_document(personality_id)]))
+
+    stale_ids = run.write(vector_db_path, vector_db)
+
+    content_hash = compute_content_hash(
+        {filename: entry["hash"] for filename, entry in run.files.items()}
+    )
+    index_version = content_hash[:12]
+    write_manifest(
+        vector_db_path,
+        {
+            "format_version": MANIFEST_FORMAT_VERSION,
+            "personality_id": personality_id or "general",
+            "index_version": index_version,
+            "content_hash": content_hash,
+            "files": run.files,
+            "chunk_count": len(run.desired_ids),
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "embedding_model": settings.EMBEDDING_MODEL_NAME,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+    )
+    print(
+        f"Vector database has {len(run.desired_ids)} chunks "
+        f"({len(run.new_chunks)} embedded, {len(stale_ids)} removed)"
+    )
+
+    # Keep the NumPy and BM25 indexes in step so any retrieval mode can serve it
+    exported = export_numpy_index(vector_db, vector_db_path, index_version)
+    export_lexical_index(exported.documents, vector_db_path, index_version)
+    return vector_db
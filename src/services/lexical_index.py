@@ -0,0 +1,233 @@
+"""
+BM25 inverted index over a personality's chunks.
+
+Built at ingestion time from the same chunks as the Chroma store and saved
+as `bm25.json` next to it. With RETRIEVAL_MODE=hybrid the HybridRetriever
+consults it first: questions that are strongly keyword-matched, such as
+personality, program or acronym names from the PDFs, are answered from the
+inverted index alone without an embeddings call, and the rest fuse lexical
+and vector rankings.
+
+The posting lists refer to chunks by their position in the NumPy export's
+`chunks.json` (see src.services.vector_index), which is written by the same
+builds.
+"""
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+
+from src.config import settings
+from src.services.vector_index import get_exported_store, write_file_atomically
+
+LEXICAL_FILENAME = "bm25.json"
+
+# Standard BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# A term in at most this share of chunks counts as a distinguishing keyword
+_RARE_TERM_RATIO = 0.02
+
+_WORD = re.compile(r"[^\W_]+")
+# Chinese, Japanese and Korean characters
+CJK_CHARACTER = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase index terms.
+
+    Words are split on non-word characters. Runs of Chinese, Japanese or
+    Korean characters, which are written without spaces, are split into
+    overlapping character bigrams instead.
+
+    Args:
+        text: The text to split
+
+    Returns:
+        The terms, in order and with repeats
+    """
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if len(word) > 1 and CJK_CHARACTER.search(word):
+            terms.extend(word[i : i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+
+class LexicalIndex:
+    """BM25 ranking of documents from an in-memory inverted index."""
+
+    def __init__(
+        self,
+        documents: List[Document],
+        postings: Dict[str, Dict[int, int]],
+        lengths: List[int],
+    ):
+        self.documents = documents
+        self.postings = postings
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths) if lengths else 0.0) or 1.0
+        count = len(documents)
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+        self.rare_df = max(1, int(count * _RARE_TERM_RATIO))
+
+    @classmethod
+    def build(cls, documents: List[Document]) -> "LexicalIndex":
+        """Index documents by the terms of their text."""
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = []
+        for position, doc in enumerate(documents):
+            terms = tokenize(doc.page_content)
+            lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, {})[position] = count
+        return cls(documents, postings, lengths)
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Rank documents against a query with BM25.
+
+        Args:
+            query: The query text
+            k: Number of documents to return
+
+        Returns:
+            (position in documents, score) pairs with a positive score, best first
+        """
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for position, count in docs.items():
+                norm = 1 - BM25_B + BM25_B * self.lengths[position] / self.avg_length
+                scores[position] = scores.get(position, 0.0) + idf * count * (
+                    BM25_K1 + 1
+                ) / (count + BM25_K1 * norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def is_keyword_match(self, query: str, position: int, min_coverage: float) -> bool:
+        """
+        Decide whether a document answers a query on keywords alone.
+
+        The document must contain a rare term of the query, and the query
+        terms it contains must carry at least `min_coverage` of the IDF
+        weight of the query terms that occur in the corpus, so a match on
+        common words never qualifies. Terms that occur nowhere, such as
+        question words missing from the PDFs, cannot be found by either
+        search and are ignored.
+
+        Args:
+            query: The query text
+            position: Position of the best lexical match in documents
+            min_coverage: Required share of the query's IDF weight, 0 to 1
+
+        Returns:
+            True if vector search can be skipped
+        """
+        total = matched = 0.0
+        has_rare = False
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            weight = self.idf[term]
+            total += weight
+            if position in docs:
+                matched += weight
+                has_rare = has_rare or len(docs) <= self.rare_df
+        return has_rare and matched >= min_coverage * total
+
+    def save(self, path: str, index_version: Optional[str]):
+        """Write the posting lists and document lengths to bm25.json."""
+        data = {
+            "index_version": index_version,
+            "lengths": self.lengths,
+            "postings": {
+                term: [[position, count] for position, count in docs.items()]
+                for term, docs in self.postings.items()
+            },
+        }
+        write_file_atomically(
+            path, LEXICAL_FILENAME, lambda f: json.dump(data, f, ensure_ascii=False)
+        )
+
+    @classmethod
+    def load(
+        cls, path: str, documents: List[Document], index_version: Optional[str]
+    ) -> Optional["LexicalIndex"]:
+        """
+        Load a saved index built from the given index version.
+
+        Returns:
+            The index, or None if it is missing or was built from another version
+        """
+        try:
+            with open(os.path.join(path, LEXICAL_FILENAME), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("index_version") != index_version:
+            return None
+        if len(data["lengths"]) != len(documents):
+            return None
+
+        postings = {
+            term: {position: count for position, count in docs}
+            for term, docs in data["postings"].items()
+        }
+        return cls(documents, postings, data["lengths"])
+
+
+def export_lexical_index(
+    documents: List[Document], path: str, index_version: Optional[str]
+) -> LexicalIndex:
+    """
+    Build the BM25 index of a vector database's chunks and save it.
+
+    Args:
+        documents: The chunks, in the order of the NumPy export
+        path: The vector database directory
+        index_version: The index version from the manifest
+
+    Returns:
+        The built index
+    """
+    index = LexicalIndex.build(documents)
+    index.save(path, index_version)
+    print(f"Indexed {len(index.postings)} terms from {len(documents)} chunks for BM25")
+    return index
+
+
+def get_lexical_index(
+    vector_db: Any, path: str, index_version: Optional[str]
+) -> LexicalIndex:
+    """
+    Load the BM25 index of a vector database, building it if it is stale.
+
+    Args:
+        vector_db: The personality's Chroma store
+        path: The Chroma store's directory
+        index_version: The Chroma index's version from its manifest
+
+    Returns:
+        The BM25 index over the current chunks
+    """
+    documents = get_exported_store(vector_db, path, index_version).documents
+    index = LexicalIndex.load(path, documents, index_version)
+    if index is not None:
+        return index
+    if settings.VECTOR_DB_READ_ONLY:
+        return LexicalIndex.build(documents)
+    return export_lexical_index(documents, path, index_version)
@@ -0,0 +1,190 @@
+"""
+Conversation memory for agent sessions.
+
+The default "buffer" mode keeps the full history. The "summary" mode keeps
+recent turns verbatim up to a token budget and folds older turns into a
+rolling summary, so the history sent to the condense-question step stays
+bounded however long a voice session runs.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional
+from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    get_buffer_string,
+)
+
+from src.config import settings
+from src.services.context_packing import approximate_tokens
+from src.services.history_store import StoredChatMessageHistory, get_history_store
+
+
+def approximate_message_tokens(messages: List[BaseMessage]) -> int:
+    """Estimate the token count of messages, counted as in approximate_tokens."""
+    return approximate_tokens(get_buffer_string(messages))
+
+
+def messages_from_context(context: List[str]) -> List[BaseMessage]:
+    """
+    Convert client-supplied conversation context into chat messages.
+
+    Args:
+        context: Previous messages, alternating user and assistant, starting
+            with the user
+
+    Returns:
+        The chat history as messages
+    """
+    return [
+        HumanMessage(content=text) if index % 2 == 0 else AIMessage(content=text)
+        for index, text in enumerate(context)
+    ]
+
+
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    """
+    Summary buffer memory that never blocks a turn on summarization.
+
+    Saving a turn only appends it. Turns beyond the token budget are folded
+    into the summary by `prune` or `aprune`, which callers run after the
+    answer has been returned. Token counts are estimated locally instead of
+    asking the LLM provider.
+
+    With a stored history the summary is kept in the history store next to
+    the messages, and summarized messages are swapped for the new summary in
+    one store operation, so any worker can continue the session.
+    """
+
+    # Estimated tokens of the messages as last loaded or saved by this
+    # session, or None before the first load
+    buffer_tokens: Optional[int] = None
+
+    def _load_buffer(self) -> List[BaseMessage]:
+        """Load the messages, and the summary when it is kept in the store."""
+        if isinstance(self.chat_memory, StoredChatMessageHistory):
+            summary, buffer = self.chat_memory.load_with_summary()
+            self.moving_summary_buffer = summary
+        else:
+            buffer = self.chat_memory.messages
+        self.buffer_tokens = approximate_message_tokens(buffer)
+        return buffer
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        buffer = self._load_buffer()
+        if self.moving_summary_buffer:
+            buffer = [
+                self.summary_message_cls(content=self.moving_summary_buffer)
+            ] + buffer
+        if self.return_messages:
+            return {self.memory_key: buffer}
+        return {
+            self.memory_key: get_buffer_string(
+                buffer, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+            )
+        }
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        BaseChatMemory.save_context(self, inputs, outputs)
+        if self.buffer_tokens is not None:
+            input_str, output_str = self._get_input_output(inputs, outputs)
+            self.buffer_tokens += approximate_message_tokens(
+                [HumanMessage(content=input_str), AIMessage(content=output_str)]
+            )
+
+    async def asave_context(
+        self, inputs: Dict[str, Any], outputs: Dict[str, str]
+    ) -> None:
+        self.save_context(inputs, outputs)
+
+    def _overflow_count(self, buffer: List[BaseMessage]) -> int:
+        """Count the oldest messages that must be summarized to fit the budget."""
+        count = 0
+        while count < len(buffer) and (
+            approximate_message_tokens(buffer[count:]) > self.max_token_limit
+        ):
+            count += 1
+        return count
+
+    def needs_pruning(self) -> bool:
+        """
+        Check the locally tracked token count against the budget, without
+        reading the store.
+
+        Turns appended by other workers are only counted once this session
+        loads the history again, which every stateful turn does. A session
+        that has not loaded its history has nothing to prune.
+        """
+        if self.buffer_tokens is None:
+            return False
+        return self.buffer_tokens > self.max_token_limit
+
+    def _drop_summarized(self, pruned: List[BaseMessage], summary: str):
+        """Remove summarized messages unless the history changed meanwhile."""
+        if isinstance(self.chat_memory, StoredChatMessageHistory):
+            compacted = self.chat_memory.compact(pruned, summary)
+        else:
+            buffer = self.chat_memory.messages
+            compacted = buffer[: len(pruned)] == pruned
+            if compacted:
+                self.chat_memory.clear()
+                self.chat_memory.add_messages(buffer[len(pruned) :])
+        if compacted:
+            self.moving_summary_buffer = summary
+            if self.buffer_tokens is not None:
+                self.buffer_tokens = max(
+                    0, self.buffer_tokens - approximate_message_tokens(pruned)
+                )
+
+    def prune(self) -> None:
+        """Fold the oldest turns beyond the token budget into the summary."""
+        buffer = self._load_buffer()
+        pruned = buffer[: self._overflow_count(buffer)]
+        if not pruned:
+            return
+        summary = self.predict_new_summary(pruned, self.moving_summary_buffer)
+        self._drop_summarized(pruned, summary)
+
+    async def aprune(self) -> None:
+        """Asynchronous version of prune; store reads and writes run in a thread."""
+        buffer = await asyncio.to_thread(self._load_buffer)
+        pruned = buffer[: self._overflow_count(buffer)]
+        if not pruned:
+            return
+        summary = await self.apredict_new_summary(pruned, self.moving_summary_buffer)
+        await asyncio.to_thread(self._drop_summarized, pruned, summary)
+
+
+def create_memory(
+    llm: BaseLanguageModel, session_key: Optional[str] = None
+) -> BaseChatMemory:
+    """
+    Create the conversation memory for a new session.
+
+    Args:
+        llm: The LLM used to summarize older turns in "summary" mode
+        session_key: Optional key under which the history is kept in the
+            configured history store; without one the history stays in-process
+
+    Returns:
+        A chat memory returning messages under the "chat_history" key
+    """
+    memory_kwargs = {
+        "memory_key": "chat_history",
+        "return_messages": True,
+        "output_key": "answer",
+    }
+    if session_key is not None:
+        memory_kwargs["chat_memory"] = StoredChatMessageHistory(
+            get_history_store(), session_key
+        )
+
+    if settings.MEMORY_MODE == "summary":
+        return TokenBudgetMemory(
+            llm=llm, max_token_limit=settings.MEMORY_TOKEN_BUDGET, **memory_kwargs
+        )
+
+    return ConversationBufferMemory(**memory_kwargs)
@@ -0,0 +1,374 @@
+"""
+Latency and token metrics for the question-answering pipeline.
+
+Every stage of an answer is timed into the `avatar_stage_seconds` histogram,
+labelled by personality and stage:
+
+- condense: rewriting a follow-up into a standalone question
+- cache_embed: embedding the question to look it up in the answer cache
+- embed: embedding the query for retrieval; after cache_embed this is
+  usually a query embedding cache hit
+- search: the vector store similarity search
+- lexical: the BM25 search of hybrid retrieval
+- first_token: from the start of the answer call to its first streamed token
+- generation: the whole answer call
+- total: the whole question, from the agent receiving it to the last token
+
+Retrievals are counted in `avatar_retrievals_total` by the path that
+served them, and query embedding cache lookups in
+`avatar_query_embedding_cache_total` by result. Tokens reported by the
+Anthropic API are counted in `avatar_llm_tokens_total` by personality, call
+(answer, condense, fallback or other) and kind: input, output, and of the
+input tokens, cache_read for those read from the prompt cache and
+cache_write for those written to it.
+
+The state of the shared components is read when `/metrics` is scraped:
+
+- avatar_upstream_active, avatar_upstream_queued and
+  avatar_upstream_rejected_total: calls running, waiting for and turned
+  away by each upstream's concurrency limit
+- avatar_upstream_circuit_state: 1 for the current state (closed, open or
+  half_open) of each upstream's circuit breaker
+- avatar_answer_cache_entries and avatar_answer_cache_lookups_total: each
+  personality's answer cache size, and its lookups by result
+- avatar_question_flights_in_progress and avatar_question_flights_total:
+  questions being generated now, and generations started or joined by an
+  identical question already in flight
+- avatar_query_embedding_cache_entries: the query embedding cache size
+
+The metrics are served in the Prometheus text format at `/metrics`. With
+OTEL_TRACING=true each stage is also recorded as an OpenTelemetry span under
+the current span, for example the request span of an instrumented FastAPI
+app.
+
+LLM calls are measured by a LangChain callback handler. It, and the
+retriever and condense steps, find the personality and which part of the
+pipeline a call belongs to in the run metadata and tags of the run config
+the agent passes to LangChain (see `run_config`).
+"""
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from src.config import settings
+
+# Run metadata key holding the personality of a LangChain run
+PERSONALITY_KEY = "personality"
+
+# Run tags naming the LLM calls of a question, checked in this order
+CONDENSE_TAG = "condense"
+FALLBACK_TAG = "fallback"
+ANSWER_TAG = "answer"
+_CALL_TAGS = (CONDENSE_TAG, FALLBACK_TAG, ANSWER_TAG)
+
+# Input token details that count as prompt cache writes; the TTL-specific
+# counts replace cache_creation when Anthropic reports them
+_CACHE_WRITE_DETAILS = (
+    "cache_creation",
+    "ephemeral_5m_input_tokens",
+    "ephemeral_1h_input_tokens",
+)
+
+# From 5 ms for cached embeddings to a minute for long generations
+_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+STAGE_SECONDS = Histogram(
+    "avatar_stage_seconds",
+    "Latency of each answer pipeline stage",
+    ["personality", "stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+RETRIEVALS = Counter(
+    "avatar_retrievals_total",
+    "Chunk retrievals by path: vector, hybrid, or lexical without an embedding call",
+    ["personality", "path"],
+)
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "avatar_query_embedding_cache_total",
+    "Query embedding cache lookups by result",
+    ["result"],
+)
+LLM_TOKENS = Counter(
+    "avatar_llm_tokens_total",
+    "Tokens used by Anthropic API calls",
+    ["personality", "call", "kind"],
+)
+
+_tracer = None
+if settings.OTEL_TRACING:
+    try:
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("avatar-api")
+    except ImportError:
+        print("WARNING: OTEL_TRACING is enabled but opentelemetry-api is not installed")
+
+
+def personality_label(personality_id: Optional[str]) -> str:
+    """Metric label for a personality ID, where None is the general agent."""
+    return personality_id or "general"
+
+
+def run_personality(run_manager: Any) -> str:
+    """Get the personality label from a LangChain run manager, if any."""
+    metadata = getattr(run_manager, "metadata", None) or {}
+    return metadata.get(PERSONALITY_KEY, personality_label(None))
+
+
+def _call_kind(tags: Optional[List[str]]) -> str:
+    """Get the kind of LLM call from its run tags."""
+    for tag in _CALL_TAGS:
+        if tag in (tags or []):
+            return tag
+    return "other"
+
+
+def observe_stage(stage: str, personality: str, seconds: float):
+    """
+    Record how long a pipeline stage took.
+
+    The span, when tracing, is created after the fact with explicit start
+    and end times, so stages inside async generators never attach or detach
+    tracing context across a yield.
+
+    Args:
+        stage: The stage name
+        personality: The personality label
+        seconds: The stage's duration
+    """
+    STAGE_SECONDS.labels(personality, stage).observe(seconds)
+    if _tracer is not None:
+        end = time.time_ns()
+        span = _tracer.start_span(
+            f"avatar.{stage}",
+            start_time=end - int(seconds * 1e9),
+            attributes={"avatar.personality": personality},
+        )
+        span.end(end_time=end)
+
+
+@contextmanager
+def timed_stage(stage: str, personality: str) -> Iterator[None]:
+    """Time the enclosed block as a pipeline stage; failed stages are not recorded."""
+    start = time.perf_counter()
+    yield
+    observe_stage(stage, personality, time.perf_counter() - start)
+
+
+def record_retrieval(personality: str, path: str):
+    """Count a retrieval by the path that served it."""
+    RETRIEVALS.labels(personality, path).inc()
+
+
+def record_embedding_cache(hit: bool):
+    """Count a query embedding cache lookup as a hit or a miss."""
+    EMBEDDING_CACHE_LOOKUPS.labels("hit" if hit else "miss").inc()
+
+
+def record_tokens(personality: str, call: str, usage: Optional[Dict[str, Any]]):
+    """
+    Count the tokens of one LLM call.
+
+    Args:
+        personality: The personality label
+        call: The kind of LLM call
+        usage: LangChain usage metadata with input_tokens, output_tokens
+            and input_token_details. Its input_tokens include the cached
+            tokens, which are also counted as cache_read and cache_write.
+    """
+    if not usage:
+        return
+    details = usage.get("input_token_details") or {}
+    counts = {
+        "input": usage.get("input_tokens"),
+        "output": usage.get("output_tokens"),
+        "cache_read": details.get("cache_read"),
+        "cache_write": sum(details.get(key) or 0 for key in _CACHE_WRITE_DETAILS),
+    }
+    for kind, count in counts.items():
+        if count:
+            LLM_TOKENS.labels(personality, call, kind).inc(count)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Callback handler timing chat model calls and counting their tokens.
+
+    Answer calls record first_token when they stream and generation when
+    they end; every call counts the tokens reported in its usage metadata.
+    """
+
+    # Cheap bookkeeping only, so run on the caller's thread or event loop
+    run_inline = True
+
+    def __init__(self):
+        # Open calls by run ID, as (start, personality, call, waiting_for_token)
+        self._runs: Dict[UUID, Tuple[float, str, str, bool]] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[BaseMessage]],
+        *,
+        run_id: UUID,
+        tags: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ):
+        personality = (metadata or {}).get(PERSONALITY_KEY, personality_label(None))
+        self._runs[run_id] = (time.perf_counter(), personality, _call_kind(tags), True)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        run = self._runs.get(run_id)
+        if run is None or not token or not run[3]:
+            return
+        start, personality, call, _ = run
+        self._runs[run_id] = (start, personality, call, False)
+        if call == ANSWER_TAG:
+            observe_stage("first_token", personality, time.perf_counter() - start)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        start, personality, call, _ = run
+        if call == ANSWER_TAG:
+            observe_stage("generation", personality, time.perf_counter() - start)
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                record_tokens(personality, call, usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._runs.pop(run_id, None)
+
+
+# One handler serves every run; runs are told apart by their run IDs
+llm_metrics_handler = LLMMetricsHandler()
+
+
+def run_config(personality_id: Optional[str], tag: str = ANSWER_TAG) -> Dict[str, Any]:
+    """
+    Build the LangChain run config that labels a pipeline's metrics.
+
+    Args:
+        personality_id: The personality answering
+        tag: The kind of LLM call the run makes
+
+    Returns:
+        A config with the personality as run metadata, the call as a tag
+        and the LLM metrics handler as a callback
+    """
+    return {
+        "metadata": {PERSONALITY_KEY: personality_label(personality_id)},
+        "tags": [tag],
+        "callbacks": [llm_metrics_handler],
+    }
+
+
+class ComponentStatsCollector:
+    """
+    Prometheus collector reading the stats of shared components at scrape time.
+
+    The components import this module to record their own metrics, so they
+    are imported when collecting rather than here.
+    """
+
+    def describe(self) -> List[Any]:
+        # Nothing to check at registration, which would import the components
+        return []
+
+    def collect(self) -> Iterator[Any]:
+        from src.services.embedding_cache import query_embedding_cache
+        from src.services.retrieval_engine import loaded_engines
+        from src.services.upstream import anthropic_upstream, openai_upstream
+
+        active = GaugeMetricFamily(
+            "avatar_upstream_active", "Upstream calls running", labels=["upstream"]
+        )
+        queued = GaugeMetricFamily(
+            "avatar_upstream_queued",
+            "Upstream calls waiting for a concurrency slot",
+            labels=["upstream"],
+        )
+        rejected = CounterMetricFamily(
+            "avatar_upstream_rejected",
+            "Upstream calls rejected by a full or timed-out queue",
+            labels=["upstream"],
+        )
+        circuit = GaugeMetricFamily(
+            "avatar_upstream_circuit_state",
+            "Circuit breaker state of each upstream, 1 for the current state",
+            labels=["upstream", "state"],
+        )
+        for client in (anthropic_upstream, openai_upstream):
+            stats = client.stats()
+            active.add_metric([client.name], stats["active"])
+            queued.add_metric([client.name], stats["queued"])
+            rejected.add_metric([client.name], stats["rejected"])
+            for state in ("closed", "open", "half_open"):
+                circuit.add_metric(
+                    [client.name, state], 1 if stats["circuit"] == state else 0
+                )
+
+        cache_entries = GaugeMetricFamily(
+            "avatar_answer_cache_entries",
+            "Answers in each personality's answer cache",
+            labels=["personality"],
+        )
+        cache_lookups = CounterMetricFamily(
+            "avatar_answer_cache_lookups",
+            "Answer cache lookups by result",
+            labels=["personality", "result"],
+        )
+        flights = GaugeMetricFamily(
+            "avatar_question_flights_in_progress",
+            "Questions being generated now",
+            labels=["personality"],
+        )
+        flight_calls = CounterMetricFamily(
+            "avatar_question_flights",
+            "Generations started, or joined by an identical question in flight",
+            labels=["personality", "result"],
+        )
+        for personality, engine in loaded_engines().items():
+            cache = engine.answer_cache.stats()
+            cache_entries.add_metric([personality], cache["size"])
+            cache_lookups.add_metric([personality, "hit"], cache["hits"])
+            cache_lookups.add_metric([personality, "miss"], cache["misses"])
+            inflight = engine.inflight.stats()
+            flights.add_metric([personality], inflight["in_flight"])
+            flight_calls.add_metric([personality, "started"], inflight["started"])
+            flight_calls.add_metric([personality, "joined"], inflight["joined"])
+
+        embeddings = GaugeMetricFamily(
+            "avatar_query_embedding_cache_entries",
+            "Embeddings in the query embedding cache",
+        )
+        embeddings.add_metric([], query_embedding_cache.stats()["size"])
+
+        yield from (active, queued, rejected, circuit)
+        yield from (cache_entries, cache_lookups, flights, flight_calls, embeddings)
+
+
+REGISTRY.register(ComponentStatsCollector())
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Render every metric in the Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
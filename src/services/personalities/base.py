@@ -4,7 +4,12 @@ Integrates voice-optimized templates from prompts.py with model spec loading.
 """
 import os
 from typing import List, Dict, Any, Optional
-from langchain.prompts import PromptTemplate
+from langchain.prompts import (
+    ChatPromptTemplate,
+    HumanMessagePromptTemplate,
+    PromptTemplate,
+)
+from langchain_core.messages import SystemMessage
 from src.config import PROJECT_ROOT
 
 
@@ -58,6 +63,13 @@ class BasePersonality:
 </reasoning_guidelines>
 """
 
+    @classmethod
+    def get_model_spec_path(cls) -> str:
+        """Get the path of the model-spec.md file for this personality."""
+        return os.path.join(
+            PROJECT_ROOT, "lib", "deepgov-modelspec", "agents", cls.id, "model-spec.md"
+        )
+
     @classmethod
     def _load_model_spec(cls) -> str:
         """
@@ -66,10 +78,7 @@ class BasePersonality:
         Looks for a model-spec.md file in the corresponding directory
         for this personality.
         """
-        # Determine path based on personality ID
-        model_spec_path = os.path.join(
-            PROJECT_ROOT, "lib", "deepgov-modelspec", "agents", cls.id, "model-spec.md"
-        )
+        model_spec_path = cls.get_model_spec_path()
 
         # Try to load the file
         try:
@@ -104,18 +113,20 @@ class BasePersonality:
         return principles if principles else None
 
     @classmethod
-    def get_model_spec_section(cls) -> str:
+    def get_model_spec_section(cls, model_spec: Optional[str] = None) -> str:
         """Get the model spec as a formatted section."""
-        model_spec = cls._load_model_spec()
+        if model_spec is None:
+            model_spec = cls._load_model_spec()
         if not model_spec:
             return ""
 
         return model_spec
 
     @classmethod
-    def get_principles_section(cls) -> str:
+    def get_principles_section(cls, model_spec: Optional[str] = None) -> str:
         """Get principles as a formatted section."""
-        model_spec = cls._load_model_spec()
+        if model_spec is None:
+            model_spec = cls._load_model_spec()
         principles = cls._extract_principles(model_spec)
 
         if not principles:
@@ -134,12 +145,25 @@ class BasePersonality:
 IMPORTANT: Your responses will be read aloud by a voice system.
 You must ALWAYS respond in the EXACT SAME LANGUAGE as the user's question."""
 
+    # Per-question part of the answer prompt, after the static system prompt
+    QUESTION_TEMPLATE = """<context>
+{context}
+</context>
+
+<question>{question}</question>
+"""
+
     @classmethod
-    def get_system_prompt(cls) -> str:
-        """Get the system prompt template with voice optimization and model spec."""
-        # Load model spec if available
-        model_spec = cls.get_model_spec_section()
-        principles_section = cls.get_principles_section()
+    def get_static_prompt(cls, model_spec: Optional[str] = None) -> str:
+        """
+        Get the part of the system prompt that is the same for every question.
+
+        The model spec is read from disk once unless it is passed in.
+        """
+        if model_spec is None:
+            model_spec = cls._load_model_spec()
+        principles_section = cls.get_principles_section(model_spec)
+        model_spec = cls.get_model_spec_section(model_spec)
 
         # Integrate model spec if available
         model_spec_instruction = f"""{model_spec}""" if model_spec else ""
@@ -148,10 +172,6 @@ You must ALWAYS respond in the EXACT SAME LANGUAGE as the user's question."""
 {cls.get_base_instructions()}{model_spec_instruction}
 </instructions>
 
-<context>
-{{context}}
-</context>
-
 {cls.VOICE_GUIDELINES}
 
 {cls.LANGUAGE_GUIDELINES}
@@ -160,19 +180,76 @@ You must ALWAYS respond in the EXACT SAME LANGUAGE as the user's question."""
 {cls.RESPONSE_GUIDELINES}
 
 {cls.REASONING_GUIDELINES}
-
-<question>{{question}}</question>
 """
 
     @classmethod
-    def get_prompt_template(cls) -> PromptTemplate:
+    def get_system_prompt(cls, model_spec: Optional[str] = None) -> str:
+        """Get the system prompt template with voice optimization and model spec."""
+        return f"{cls.get_static_prompt(model_spec)}\n{cls.QUESTION_TEMPLATE}"
+
+    @classmethod
+    def get_prompt_template(cls, model_spec: Optional[str] = None) -> PromptTemplate:
         """Get the prompt template configured for this personality."""
         # If you want to use the default template from prompts.py directly:
         # return VOICE_QA_PROMPT
 
         # Or use the custom template with model spec integration:
         return PromptTemplate(
-            template=cls.get_system_prompt(), input_variables=["context", "question"]
+            template=cls.get_system_prompt(model_spec),
+            input_variables=["context", "question"],
+        )
+
+    @classmethod
+    def get_chat_prompt_template(
+        cls, model_spec: Optional[str] = None, cache: bool = True
+    ) -> ChatPromptTemplate:
+        """
+        Get the prompt as a system message and a per-question human message.
+
+        The static prompt is sent as the system block and the retrieved
+        context and question as the human message, so the system block is
+        a prefix shared by every question of the personality.
+
+        Args:
+            model_spec: The model spec text, read from disk if None
+            cache: Mark the system block for Anthropic prompt caching
+
+        Returns:
+            A chat prompt template with context and question variables
+        """
+        system_block: Dict[str, Any] = {
+            "type": "text",
+            "text": cls.get_static_prompt(model_spec),
+        }
+        if cache:
+            system_block["cache_control"] = {"type": "ephemeral"}
+        return ChatPromptTemplate.from_messages(
+            [
+                # A message rather than a template, so braces in the model
+                # spec are never read as variables
+                SystemMessage(content=[system_block]),
+                HumanMessagePromptTemplate.from_template(cls.QUESTION_TEMPLATE),
+            ]
+        )
+
+    @classmethod
+    def get_fallback_response(cls) -> str:
+        """Get the canned answer given when no knowledge base is available."""
+        return (
+            f"I'm {cls.name}. My knowledge base is not available right now, "
+            "so I can't answer questions about my documents. Please try again later."
+        )
+
+    @classmethod
+    def get_fallback_prompt_template(cls) -> PromptTemplate:
+        """Get a short prompt for degraded answers when no knowledge base is available."""
+        return PromptTemplate(
+            template=f"""You are {cls.name}, a voice assistant whose document knowledge base is currently unavailable.
+In one or two short spoken sentences, in the EXACT SAME LANGUAGE as the question, say that you cannot answer from your documents right now and suggest trying again later. Do not answer the question itself.
+
+<question>{{question}}</question>
+""",
+            input_variables=["question"],
         )
 
     @classmethod
@@ -3,12 +3,13 @@ Personality manager to handle access to different AI personalities.
 Acts as a facade for the personality system.
 """
 from typing import Dict, Any, List, Optional, Type
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import BasePromptTemplate
 
 from src.services.personalities import BasePersonality, PERSONALITY_CLASSES
+from src.services.prompt_registry import CompiledPrompt, prompt_registry
 
 
-def get_personality_prompt(personality_id: str) -> PromptTemplate:
+def get_personality_prompt(personality_id: str) -> BasePromptTemplate:
     """
     Get the prompt template for a specific personality.
 
@@ -16,15 +17,62 @@ def get_personality_prompt(personality_id: str) -> PromptTemplate:
         personality_id: The ID of the personality
 
     Returns:
-        A PromptTemplate configured for the personality
+        A chat prompt template configured for the personality
     """
-    personality_class = _get_personality_class(personality_id)
-    return personality_class.get_prompt_template()
+    return get_compiled_prompt(personality_id).template
 
 
-def get_default_prompt() -> PromptTemplate:
+def get_default_prompt() -> BasePromptTemplate:
     """Get a default prompt template"""
-    return BasePersonality.get_prompt_template()
+    return get_compiled_prompt(None).template
+
+
+def get_compiled_prompt(personality_id: Optional[str]) -> CompiledPrompt:
+    """
+    Get the compiled prompt for a personality from the shared registry.
+
+    Args:
+        personality_id: The ID of the personality, or None for the default prompt
+
+    Returns:
+        The compiled prompt, recompiled if its model spec file changed
+    """
+    if personality_id is None:
+        return prompt_registry.get(BasePersonality)
+    return prompt_registry.get(_get_personality_class(personality_id))
+
+
+def get_personality_class(personality_id: Optional[str]) -> Type[BasePersonality]:
+    """
+    Get the personality class for an ID, or the base class for the default prompt.
+
+    Args:
+        personality_id: The ID of the personality, or None
+
+    Returns:
+        Personality class
+    """
+    if personality_id is None:
+        return BasePersonality
+    return _get_personality_class(personality_id)
+
+
+def preload_prompts():
+    """Compile the default prompt and every personality prompt."""
+    prompt_registry.preload([BasePersonality, *PERSONALITY_CLASSES.values()])
+
+
+def personality_exists(personality_id: str) -> bool:
+    """
+    Check whether an ID names a registered personality.
+
+    Args:
+        personality_id: The ID of the personality
+
+    Returns:
+        True if the personality is registered
+    """
+    return personality_id in PERSONALITY_CLASSES
 
 
 def get_personality_info(personality_id: str) -> Dict[str, Any]:
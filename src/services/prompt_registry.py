@@ -0,0 +1,95 @@
+"""
+Registry of compiled personality prompts.
+
+Each personality's chat prompt template is compiled once, together with the
+principles extracted from its model spec, and reused by every engine and
+session. A prompt is recompiled only when the modification time of its
+`lib/deepgov-modelspec/agents/<id>/model-spec.md` file changes.
+
+The static part of the prompt is the system message and, with
+PROMPT_CACHING on, is marked for Anthropic prompt caching, so follow-up
+calls within the cache lifetime read it from the cache instead of
+processing it again.
+"""
+import hashlib
+import os
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Type
+from langchain_core.prompts import BasePromptTemplate
+
+from src.config import settings
+
+from src.services.personalities import BasePersonality
+
+
+class CompiledPrompt(NamedTuple):
+    """A compiled prompt template and the model spec it was built from."""
+
+    template: BasePromptTemplate
+    principles: List[str]
+    fingerprint: str
+    spec_mtime: Optional[float]
+
+
+def _spec_mtime(personality_class: Type[BasePersonality]) -> Optional[float]:
+    """Get the model spec's modification time, or None if it does not exist."""
+    try:
+        return os.stat(personality_class.get_model_spec_path()).st_mtime
+    except OSError:
+        return None
+
+
+class PromptRegistry:
+    """Thread-safe cache of compiled prompts keyed by personality ID."""
+
+    def __init__(self):
+        self._prompts: Dict[str, CompiledPrompt] = {}
+        self._lock = threading.Lock()
+
+    def get(self, personality_class: Type[BasePersonality]) -> CompiledPrompt:
+        """
+        Get the compiled prompt for a personality, recompiling it if its spec changed.
+
+        Args:
+            personality_class: The personality class
+
+        Returns:
+            The compiled prompt
+        """
+        mtime = _spec_mtime(personality_class)
+        compiled = self._prompts.get(personality_class.id)
+        if compiled is not None and compiled.spec_mtime == mtime:
+            return compiled
+
+        with self._lock:
+            compiled = self._prompts.get(personality_class.id)
+            if compiled is None or compiled.spec_mtime != mtime:
+                compiled = self._compile(personality_class, mtime)
+                self._prompts[personality_class.id] = compiled
+            return compiled
+
+    def _compile(
+        self, personality_class: Type[BasePersonality], mtime: Optional[float]
+    ) -> CompiledPrompt:
+        """Read the model spec once and build the prompt template from it."""
+        model_spec = personality_class._load_model_spec() if mtime is not None else ""
+        template = personality_class.get_chat_prompt_template(
+            model_spec, cache=settings.PROMPT_CACHING
+        )
+        return CompiledPrompt(
+            template=template,
+            principles=personality_class._extract_principles(model_spec) or [],
+            fingerprint=hashlib.sha256(
+                personality_class.get_system_prompt(model_spec).encode("utf-8")
+            ).hexdigest()[:16],
+            spec_mtime=mtime,
+        )
+
+    def preload(self, personality_classes: Iterable[Type[BasePersonality]]):
+        """Compile the prompts for the given personalities ahead of the first request."""
+        for personality_class in personality_classes:
+            self.get(personality_class)
+
+
+# Process-wide registry shared by every engine
+prompt_registry = PromptRegistry()
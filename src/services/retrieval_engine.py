@@ -0,0 +1,361 @@
+"""
+Shared retrieval engine for each personality.
+
+An engine owns the expensive, process-wide resources for one personality:
+the embedding client, the LLM client, the Chroma vector store and the
+conversation chain. Per-user conversation state lives in lightweight
+AIAgent sessions that reference the shared engine.
+"""
+import asyncio
+import os
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional
+from langchain_community.vectorstores import Chroma
+from langchain.chains import ConversationalRetrievalChain
+from langchain.retrievers import ContextualCompressionRetriever
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.retrievers import BaseRetriever
+
+from src.config import settings
+from src.services.answer_cache import AnswerCache
+from src.services.clients import get_chat_model
+from src.services.coalescing import SingleFlight
+from src.services.condense import StandaloneQuestionChain
+from src.services.context_packing import ContextPacker
+from src.services.fallback import FallbackResponder
+from src.services.ingestion import build_vector_db, create_embeddings, read_manifest
+from src.services.lexical_index import get_lexical_index
+from src.services.personalities import PERSONALITY_CLASSES
+from src.services.personality_manager import get_compiled_prompt, personality_exists
+from src.services.prompt_registry import CompiledPrompt
+from src.services.retrievers import HybridRetriever, VectorSearchRetriever
+from src.services.vector_index import get_search_store
+
+
+class AnswerChain(NamedTuple):
+    """A compiled prompt and the conversation chain built with it."""
+
+    compiled_prompt: CompiledPrompt
+    conversation_chain: Optional[ConversationalRetrievalChain]
+
+    @property
+    def qa_prompt(self) -> BasePromptTemplate:
+        return self.compiled_prompt.template
+
+
+class RetrievalEngine:
+    """Process-wide vector store, clients and chain for one personality."""
+
+    def __init__(self, personality_id: Optional[str] = None):
+        self.personality_id = personality_id
+        self.embeddings = create_embeddings()
+        self.is_fallback_mode = False
+
+        # Chat models are shared process-wide and use the pooled HTTP clients
+        self.llm = get_chat_model(
+            settings.ANTHROPIC_MODEL_NAME, temperature=0.2, max_tokens=2000
+        )
+
+        # Optional smaller model for rewriting follow-up questions
+        self.condense_llm = None
+        if settings.CONDENSE_MODEL_NAME:
+            self.condense_llm = get_chat_model(
+                settings.CONDENSE_MODEL_NAME, temperature=0, max_tokens=256
+            )
+
+        # Replaced as a whole when the prompt changes, so readers never see
+        # a new prompt with an old chain
+        self.answer_chain = AnswerChain(get_compiled_prompt(personality_id), None)
+        self._refresh_lock = threading.Lock()
+        self.vector_db_path = os.path.join(
+            settings.VECTOR_DB_PATH, personality_id or "general"
+        )
+
+        self.vector_db = None
+        self.search_store = None
+        self.lexical_index = None
+        self.fallback: Optional[FallbackResponder] = None
+        self.index_version = None
+
+        # Initialize the vector database
+        self._initialize_vector_db()
+
+        # Cache of first-turn answers, cleared when the index or prompt changes
+        self.answer_cache = AnswerCache(
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        )
+
+        # Identical questions in flight at the same time share one generation
+        self.inflight = SingleFlight()
+
+    @property
+    def compiled_prompt(self) -> CompiledPrompt:
+        return self.answer_chain.compiled_prompt
+
+    @property
+    def qa_prompt(self) -> BasePromptTemplate:
+        return self.answer_chain.qa_prompt
+
+    @property
+    def conversation_chain(self) -> Optional[ConversationalRetrievalChain]:
+        return self.answer_chain.conversation_chain
+
+    @property
+    def cache_fingerprint(self) -> str:
+        """Identify the index and prompt that cached answers were generated with."""
+        return f"{self.index_version}:{self.compiled_prompt.fingerprint}"
+
+    def refresh_prompt(self):
+        """
+        Rebuild the chain if the personality's model spec has changed on disk.
+
+        One caller rebuilds it while the others keep answering with the
+        current chain; the new prompt and chain are published together.
+        """
+        compiled = get_compiled_prompt(self.personality_id)
+        if compiled is self.compiled_prompt:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if compiled is not self.compiled_prompt:
+                chain = None
+                if self.conversation_chain is not None:
+                    chain = self._build_conversation_chain(compiled.template)
+                self.answer_chain = AnswerChain(compiled, chain)
+                print(f"Reloaded prompt for {self.personality_id or 'general'}")
+        finally:
+            self._refresh_lock.release()
+
+    def _initialize_vector_db(self):
+        """Initialize or load the vector database from PDFs."""
+        name = self.personality_id or "general"
+
+        # Check if the vector database already exists
+        if os.path.exists(os.path.join(self.vector_db_path, "chroma.sqlite3")):
+            print(f"Loading existing vector database for {name}...")
+            self._check_manifest()
+            self.vector_db = Chroma(
+                persist_directory=self.vector_db_path,
+                embedding_function=self.embeddings,
+            )
+        elif settings.VECTOR_DB_READ_ONLY:
+            # Prebuilt indexes only: never parse PDFs or embed on the serving path
+            print(
+                f"WARNING: No prebuilt vector database for {name} at "
+                f"{self.vector_db_path}; run `python -m src.build_index`"
+            )
+        else:
+            print(f"Creating new vector database for {name}...")
+            # Process PDFs and create the vector database
+            self._create_vector_db_from_pdfs()
+
+        if self.vector_db:
+            manifest = read_manifest(self.vector_db_path) or {}
+            self.index_version = manifest.get("index_version")
+            # Chroma, or its NumPy export with VECTOR_BACKEND=numpy
+            self.search_store = get_search_store(
+                self.vector_db, self.vector_db_path, self.index_version
+            )
+            if settings.RETRIEVAL_MODE == "hybrid":
+                self.lexical_index = get_lexical_index(
+                    self.vector_db, self.vector_db_path, self.index_version
+                )
+
+        # Create the conversation chain
+        self._create_conversation_chain()
+
+    def _check_manifest(self):
+        """Log the prebuilt index version and warn about embedding model mismatches."""
+        manifest = read_manifest(self.vector_db_path)
+        if not manifest:
+            return
+
+        print(
+            f"Index {manifest.get('index_version')} built {manifest.get('built_at')} "
+            f"with {manifest.get('chunk_count')} chunks"
+        )
+        if manifest.get("embedding_model") != settings.EMBEDDING_MODEL_NAME:
+            print(
+                f"WARNING: Index was built with {manifest.get('embedding_model')} "
+                f"but queries use {settings.EMBEDDING_MODEL_NAME}"
+            )
+
+    def _create_conversation_chain(self):
+        """
+        Create the shared conversation chain for the current vector database.
+
+        The chain is built without memory; each session passes its own chat
+        history in on every call so one chain can serve every user. The
+        chain already skips condensing when there is no history; with
+        CONDENSE_MODE=heuristic it also skips follow-ups that look standalone.
+        """
+        if self.vector_db:
+            # Create normal conversation chain with retriever
+            self.answer_chain = AnswerChain(
+                self.compiled_prompt, self._build_conversation_chain(self.qa_prompt)
+            )
+            self.is_fallback_mode = False
+        else:
+            # Degraded mode: there is nothing to retrieve, so answer with the
+            # personality's canned response or a short generation instead
+            # of running the full QA prompt on an empty context
+            print("WARNING: Using fallback mode without vector database")
+            self.answer_chain = AnswerChain(self.compiled_prompt, None)
+            self.fallback = FallbackResponder(self.personality_id)
+            self.is_fallback_mode = True
+
+    def _build_conversation_chain(
+        self, qa_prompt: BasePromptTemplate
+    ) -> ConversationalRetrievalChain:
+        """Build a conversation chain answering with the given QA prompt."""
+        chain = ConversationalRetrievalChain.from_llm(
+            llm=self.llm,
+            retriever=self._create_retriever(),
+            return_source_documents=True,
+            combine_docs_chain_kwargs={"prompt": qa_prompt},
+            condense_question_llm=self.condense_llm,
+        )
+        chain.question_generator = StandaloneQuestionChain(
+            condense_chain=chain.question_generator,
+            use_heuristic=settings.CONDENSE_MODE == "heuristic",
+        )
+        return chain
+
+    def _create_retriever(self) -> BaseRetriever:
+        """
+        Create the retriever for the configured retrieval mode.
+
+        Retrieved chunks are packed before they are stuffed into the prompt:
+        overlapping chunks are merged, weak matches dropped and the context
+        capped at CONTEXT_TOKEN_BUDGET.
+        """
+        if self.lexical_index is None:
+            retriever = VectorSearchRetriever(
+                vectorstore=self.search_store, embeddings=self.embeddings, k=4
+            )
+        else:
+            retriever = HybridRetriever(
+                vectorstore=self.search_store,
+                embeddings=self.embeddings,
+                k=4,
+                lexical_index=self.lexical_index,
+                fetch_k=settings.HYBRID_FETCH_K,
+                keyword_coverage=settings.HYBRID_KEYWORD_COVERAGE,
+            )
+        return ContextualCompressionRetriever(
+            base_compressor=ContextPacker(
+                min_score=settings.CONTEXT_MIN_SCORE,
+                token_budget=settings.CONTEXT_TOKEN_BUDGET,
+            ),
+            base_retriever=retriever,
+        )
+
+    def _create_vector_db_from_pdfs(self):
+        """Create a vector database from PDF files in the configured directory."""
+        self.vector_db = build_vector_db(
+            self.personality_id, self.vector_db_path, self.embeddings
+        )
+
+
+# Engines are shared by every session in the process, keyed by personality ID
+_engines: Dict[str, RetrievalEngine] = {}
+_engine_locks: Dict[str, threading.Lock] = {}
+_engine_status: Dict[str, str] = {}
+_registry_lock = threading.Lock()
+
+# Readiness states reported by get_engine_status
+STATUS_NOT_LOADED = "not_loaded"
+STATUS_LOADING = "loading"
+STATUS_READY = "ready"
+STATUS_FALLBACK = "fallback"
+STATUS_ERROR = "error"
+
+
+def get_engine(personality_id: Optional[str] = None) -> RetrievalEngine:
+    """
+    Get or create the shared retrieval engine for a personality.
+
+    Each personality is built at most once; concurrent callers asking for the
+    same personality wait for the first build instead of starting their own.
+    Building may parse PDFs and call the embeddings API, so call this from a
+    worker thread when on the event loop.
+
+    Args:
+        personality_id: The personality ID, or None for the general engine
+
+    Returns:
+        The shared RetrievalEngine instance
+
+    Raises:
+        ValueError: If personality_id is not a registered personality
+    """
+    # Engines are never freed, so only known personalities may create one
+    if personality_id is not None and not personality_exists(personality_id):
+        raise ValueError(f"Unknown personality: {personality_id}")
+
+    key = personality_id or "general"
+
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+
+    with _registry_lock:
+        lock = _engine_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        if key not in _engines:
+            _engine_status[key] = STATUS_LOADING
+            try:
+                engine = RetrievalEngine(personality_id=personality_id)
+            except Exception:
+                _engine_status[key] = STATUS_ERROR
+                raise
+            _engines[key] = engine
+            _engine_status[key] = (
+                STATUS_FALLBACK if engine.is_fallback_mode else STATUS_READY
+            )
+        return _engines[key]
+
+
+def loaded_engines() -> Dict[str, RetrievalEngine]:
+    """
+    Get the engines built so far.
+
+    Returns:
+        Dictionary mapping engine keys ("general" or a personality ID) to engines
+    """
+    return dict(_engines)
+
+
+def get_engine_status() -> Dict[str, str]:
+    """
+    Get the readiness of the general engine and every known personality.
+
+    Returns:
+        Dictionary mapping engine keys to a readiness state
+    """
+    keys = ["general", *PERSONALITY_CLASSES.keys()]
+    return {key: _engine_status.get(key, STATUS_NOT_LOADED) for key in keys}
+
+
+async def warm_up_engines(personality_ids: Iterable[Optional[str]]):
+    """
+    Load or build engines concurrently in worker threads.
+
+    Failures are logged and reported through get_engine_status rather than
+    raised, so one broken personality does not stop the others.
+
+    Args:
+        personality_ids: Personality IDs to warm, None for the general engine
+    """
+    personality_ids = list(personality_ids)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(get_engine, pid) for pid in personality_ids),
+        return_exceptions=True,
+    )
+    for pid, result in zip(personality_ids, results):
+        if isinstance(result, Exception):
+            print(f"Error warming up engine for {pid or 'general'}: {result}")
@@ -0,0 +1,160 @@
+"""
+Retrievers used by the conversation chains.
+
+VectorSearchRetriever embeds the query and searches the vector store as two
+separate steps, so embedding and search latency are measured apart. Vector
+results carry their cosine similarity in their metadata for context packing.
+HybridRetriever adds a BM25 index in front of it: strong keyword matches
+skip the embedding call entirely, and other queries fuse the lexical and
+vector rankings.
+"""
+from typing import Dict, List, Tuple
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.vectorstores import VectorStore
+
+from src.services.lexical_index import LexicalIndex
+from src.services.metrics import record_retrieval, run_personality, timed_stage
+from src.services.vector_index import SCORE_KEY, scored_search
+
+# Rank offset of reciprocal rank fusion; damps the weight of the top ranks
+RRF_K = 60
+
+
+def document_key(doc: Document) -> str:
+    """Identify a chunk across retrievers by its content hash, or its text."""
+    return doc.metadata.get("chunk_hash") or doc.page_content
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int) -> List[Document]:
+    """
+    Merge rankings by summing 1 / (RRF_K + rank) for each document.
+
+    A document found by several retrievers is returned as the copy that
+    carries a similarity score, so context packing can still filter it.
+
+    Args:
+        rankings: Ranked document lists, best first
+        k: Number of documents to return
+
+    Returns:
+        The k documents with the highest fused score
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            seen = documents.get(key)
+            if seen is None or (
+                SCORE_KEY not in seen.metadata and SCORE_KEY in doc.metadata
+            ):
+                documents[key] = doc
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+
+class VectorSearchRetriever(BaseRetriever):
+    """Similarity search over a vector store with timed embed and search stages."""
+
+    vectorstore: VectorStore
+    embeddings: Embeddings
+    k: int = 4
+
+    def _search(self, query: str, k: int, personality: str) -> List[Document]:
+        with timed_stage("embed", personality):
+            embedding = self.embeddings.embed_query(query)
+        with timed_stage("search", personality):
+            return scored_search(self.vectorstore, embedding, k)
+
+    async def _asearch(self, query: str, k: int, personality: str) -> List[Document]:
+        with timed_stage("embed", personality):
+            embedding = await self.embeddings.aembed_query(query)
+        with timed_stage("search", personality):
+            return await run_in_executor(
+                None, scored_search, self.vectorstore, embedding, k
+            )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        personality = run_personality(run_manager)
+        record_retrieval(personality, "vector")
+        return self._search(query, self.k, personality)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        personality = run_personality(run_manager)
+        record_retrieval(personality, "vector")
+        return await self._asearch(query, self.k, personality)
+
+
+class HybridRetriever(VectorSearchRetriever):
+    """
+    BM25 and vector retrieval with reciprocal rank fusion.
+
+    When the best BM25 match is a keyword match for the query (see
+    LexicalIndex.is_keyword_match) the BM25 ranking is returned as is.
+    Otherwise `fetch_k` candidates from each ranking are fused and the top
+    k returned, which recovers exact-term matches that embedding similarity
+    ranks just below k.
+    """
+
+    lexical_index: LexicalIndex
+    fetch_k: int = 10
+    keyword_coverage: float = 0.9
+
+    def _lexical_search(
+        self, query: str, personality: str
+    ) -> Tuple[List[Document], bool]:
+        """
+        Rank chunks with BM25.
+
+        Returns:
+            The fetch_k best chunks, and whether the best is a keyword match
+        """
+        with timed_stage("lexical", personality):
+            hits = self.lexical_index.search(query, self.fetch_k)
+            keyword_match = (
+                bool(hits)
+                and self.keyword_coverage > 0
+                and self.lexical_index.is_keyword_match(
+                    query, hits[0][0], self.keyword_coverage
+                )
+            )
+        documents = [self.lexical_index.documents[position] for position, _ in hits]
+        return documents, keyword_match
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        personality = run_personality(run_manager)
+        lexical, keyword_match = self._lexical_search(query, personality)
+        if keyword_match:
+            record_retrieval(personality, "lexical")
+            return lexical[: self.k]
+
+        record_retrieval(personality, "hybrid")
+        vector = self._search(query, self.fetch_k, personality)
+        return reciprocal_rank_fusion([lexical, vector], self.k)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        personality = run_personality(run_manager)
+        lexical, keyword_match = self._lexical_search(query, personality)
+        if keyword_match:
+            record_retrieval(personality, "lexical")
+            return lexical[: self.k]
+
+        record_retrieval(personality, "hybrid")
+        vector = await self._asearch(query, self.fetch_k, personality)
+        return reciprocal_rank_fusion([lexical, vector], self.k)
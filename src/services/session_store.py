@@ -0,0 +1,167 @@
+"""
+Bounded store for per-user conversation sessions.
+
+Sessions are kept in least-recently-used order and evicted when the store
+grows past its maximum size or when a session has been idle longer than the
+configured TTL. Expired sessions are also swept by a background task so idle
+workers release memory without waiting for new traffic.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class SessionStore:
+    """Thread-safe LRU store with idle TTL and hit/miss/eviction counters."""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _is_expired(self, last_used: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - last_used > self.ttl_seconds
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Get a session and mark it as recently used.
+
+        Args:
+            key: The session key
+
+        Returns:
+            The session, or None if it does not exist or has expired
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, last_used = entry
+            if not self._is_expired(last_used, now):
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+            del self._entries[key]
+            self.evictions += 1
+            self.misses += 1
+
+        self._notify_evicted([(key, value)])
+        return None
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Get a session, creating it with the factory if it does not exist.
+
+        Args:
+            key: The session key
+            factory: Callable that builds a new session
+
+        Returns:
+            The existing or newly created session
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        value = factory()
+        with self._lock:
+            # Another caller may have created the session in the meantime
+            entry = self._entries.get(key)
+            if entry is not None:
+                value = entry[0]
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            evicted = self._evict_overflow()
+        self._notify_evicted(evicted)
+        return value
+
+    def drop(self, key: Hashable) -> bool:
+        """
+        Remove a session.
+
+        Args:
+            key: The session key
+
+        Returns:
+            True if a session was removed
+        """
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def evict_expired(self) -> int:
+        """
+        Remove every session that has been idle longer than the TTL.
+
+        Returns:
+            The number of sessions evicted
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                (key, value)
+                for key, (value, last_used) in self._entries.items()
+                if self._is_expired(last_used, now)
+            ]
+            for key, _ in expired:
+                del self._entries[key]
+            self.evictions += len(expired)
+        self._notify_evicted(expired)
+        return len(expired)
+
+    def _evict_overflow(self) -> List[Tuple[Hashable, Any]]:
+        """Evict least recently used sessions beyond the size limit. Caller holds the lock."""
+        evicted = []
+        while self.max_entries > 0 and len(self._entries) > self.max_entries:
+            key, (value, _) = self._entries.popitem(last=False)
+            evicted.append((key, value))
+            self.evictions += 1
+        return evicted
+
+    def _notify_evicted(self, evicted: List[Tuple[Hashable, Any]]):
+        """Run the eviction callback outside the lock."""
+        if self.on_evict is None:
+            return
+        for key, value in evicted:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                print(f"Error releasing evicted session {key}: {e}")
+
+    async def run_eviction_loop(self, interval_seconds: float):
+        """Periodically evict expired sessions until cancelled."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            evicted = self.evict_expired()
+            if evicted:
+                print(f"Evicted {evicted} idle sessions")
+
+    def stats(self) -> Dict[str, int]:
+        """Get the current size and hit, miss and eviction counters."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
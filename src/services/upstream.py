@@ -0,0 +1,445 @@
+"""
+Admission control, retries and circuit breaking for upstream API calls.
+
+Every call to the Anthropic and OpenAI APIs made while answering a question
+goes through the provider's UpstreamClient:
+
+- a ConcurrencyLimiter caps the calls in flight per provider and keeps a
+  bounded FIFO queue; when the queue is full, or a caller waits longer than
+  the queue timeout, the call fails fast with OverloadedError
+- transient errors (rate limits, overload, timeouts, connection errors) are
+  retried with jittered exponential backoff, honouring Retry-After
+- a CircuitBreaker stops calling a provider after repeated failures and lets
+  a single probe through once the reset timeout has passed
+
+OverloadedError carries a retry_after hint that the API returns as a 503
+response with a Retry-After header, so a load spike degrades into quick
+rejections instead of a pile of blocked requests.
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
+import anthropic
+import openai
+
+from src.config import settings
+
+T = TypeVar("T")
+
+
+def _sdk_errors(module: Any, *names: str) -> Tuple[Type[Exception], ...]:
+    """Get the named exception classes that exist in the installed SDK version."""
+    return tuple(getattr(module, name) for name in names if hasattr(module, name))
+
+
+# Errors from the provider SDKs that are worth retrying. Recent Anthropic SDKs
+# raise OverloadedError (529), ServiceUnavailableError (503) and
+# DeadlineExceededError (504) as APIStatusError subclasses that are not
+# InternalServerErrors; older ones raise InternalServerError for all of them.
+RETRYABLE_ANTHROPIC_ERRORS: Tuple[Type[Exception], ...] = _sdk_errors(
+    anthropic,
+    "RateLimitError",
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "OverloadedError",
+    "ServiceUnavailableError",
+    "DeadlineExceededError",
+)
+RETRYABLE_OPENAI_ERRORS: Tuple[Type[Exception], ...] = _sdk_errors(
+    openai,
+    "RateLimitError",
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+)
+
+
+class OverloadedError(Exception):
+    """Raised when a call is rejected or gives up because a service is overloaded."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def retry_delay(
+    error: Exception, attempt: int, base_seconds: float, max_seconds: float
+) -> float:
+    """
+    Get the wait before retrying a failed call.
+
+    Honours a Retry-After header on the error's response; otherwise backs off
+    exponentially from base_seconds with jitter, capped at max_seconds.
+
+    Args:
+        error: The error raised by the call
+        attempt: Zero-based number of the failed attempt
+        base_seconds: Backoff for the first retry
+        max_seconds: Maximum backoff
+
+    Returns:
+        Seconds to wait
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after:
+            return min(max_seconds, float(retry_after))
+    except ValueError:
+        pass
+    return min(max_seconds, base_seconds * 2**attempt) * (0.5 + random.random() / 2)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Closed: calls pass. After failure_threshold consecutive failures the
+    circuit opens and calls are rejected for reset_seconds. Then it is half
+    open: one probe call passes, and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return "open"
+            return "half_open"
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a probe through, 0 when it is closed."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def before_call(self, name: str) -> bool:
+        """
+        Reject the call if the circuit is open or a probe is already running.
+
+        Returns:
+            True if the call is the half-open probe
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if remaining <= 0 and not self._probing:
+                self._probing = True
+                return True
+        raise OverloadedError(
+            f"{name} is unavailable after repeated failures",
+            retry_after=max(remaining, 1),
+        )
+
+    def end_probe(self):
+        """Let another probe through if the probe ended without a verdict."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    print(f"Circuit opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class _Waiter:
+    """A queued caller; `notify` wakes it once a slot has been handed over."""
+
+    __slots__ = ("granted", "notify")
+
+    def __init__(self, notify: Callable[[], None]):
+        self.granted = False
+        self.notify = notify
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ConcurrencyLimiter:
+    """
+    FIFO concurrency limit with a bounded wait queue, for sync and async callers.
+
+    Use `async with limiter:` from coroutines and `with limiter:` from threads;
+    both share the same slots.
+    """
+
+    def __init__(
+        self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _overloaded(self) -> OverloadedError:
+        self.rejected += 1
+        return OverloadedError(
+            f"{self.name} is at capacity", retry_after=self.queue_timeout
+        )
+
+    def _enter(self, waiter: _Waiter) -> bool:
+        """Take a free slot or join the queue. Returns True if a slot was taken."""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                return True
+            if len(self._waiters) >= self.max_queue:
+                raise self._overloaded()
+            self._waiters.append(waiter)
+            return False
+
+    def _leave_queue(self, waiter: _Waiter) -> bool:
+        """Leave the queue unless a slot was handed over meanwhile. Returns True if it was."""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+            return waiter.granted
+
+    def check(self):
+        """Raise OverloadedError if a new caller would be rejected right now."""
+        with self._lock:
+            if (
+                self._active >= self.max_concurrency
+                and len(self._waiters) >= self.max_queue
+            ):
+                raise self._overloaded()
+
+    def release(self):
+        """Release a slot, handing it to the oldest waiter if there is one."""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.notify()
+            else:
+                self._active -= 1
+
+    async def acquire(self):
+        """Wait for a slot, failing fast when the queue is full or the wait times out."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = _Waiter(lambda: loop.call_soon_threadsafe(_resolve, future))
+        if self._enter(waiter):
+            return
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._leave_queue(waiter):
+                raise self._overloaded()
+        except asyncio.CancelledError:
+            if self._leave_queue(waiter):
+                self.release()
+            raise
+
+    def acquire_sync(self):
+        """Blocking version of acquire for callers on worker threads."""
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        if self._enter(waiter):
+            return
+        if not event.wait(self.queue_timeout) and not self._leave_queue(waiter):
+            raise self._overloaded()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def __enter__(self):
+        self.acquire_sync()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "active": self._active,
+                "queued": len(self._waiters),
+                "rejected": self.rejected,
+            }
+
+
+class UpstreamClient:
+    """Concurrency limit, retries and circuit breaker for one upstream provider."""
+
+    def __init__(
+        self,
+        name: str,
+        retryable_errors: Tuple[Type[Exception], ...],
+        max_concurrency: int,
+    ):
+        self.name = name
+        self.retryable_errors = retryable_errors
+        self.limiter = ConcurrencyLimiter(
+            name,
+            max_concurrency=max_concurrency,
+            max_queue=settings.UPSTREAM_QUEUE_SIZE,
+            queue_timeout=settings.UPSTREAM_QUEUE_TIMEOUT_SECONDS,
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            reset_seconds=settings.CIRCUIT_RESET_SECONDS,
+        )
+        self.max_retries = settings.UPSTREAM_MAX_RETRIES
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        return retry_delay(
+            error,
+            attempt,
+            settings.UPSTREAM_RETRY_BASE_SECONDS,
+            settings.UPSTREAM_RETRY_MAX_SECONDS,
+        )
+
+    def _give_up(self, error: Exception) -> OverloadedError:
+        """Record a call that failed every attempt and turn it into an OverloadedError."""
+        self.breaker.record_failure()
+        print(f"{self.name} call failed after retries: {error}")
+        return OverloadedError(
+            f"{self.name} is overloaded or unreachable",
+            retry_after=max(self.breaker.retry_after(), self._retry_delay(error, 0)),
+        )
+
+    def check(self):
+        """Raise OverloadedError if the circuit is open or the queue is full."""
+        if self.breaker.state == "open":
+            raise OverloadedError(
+                f"{self.name} is unavailable after repeated failures",
+                retry_after=self.breaker.retry_after(),
+            )
+        self.limiter.check()
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run an upstream coroutine with admission control and retries.
+
+        Args:
+            fn: Callable returning a new coroutine for each attempt
+
+        Returns:
+            The coroutine's result
+
+        Raises:
+            OverloadedError: If the call is rejected or fails every attempt
+        """
+        probe = self.breaker.before_call(self.name)
+        try:
+            async with self.limiter:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        result = await fn()
+                    except self.retryable_errors as e:
+                        if attempt == self.max_retries:
+                            raise self._give_up(e) from e
+                        await asyncio.sleep(self._retry_delay(e, attempt))
+                    else:
+                        self.breaker.record_success()
+                        return result
+        finally:
+            if probe:
+                self.breaker.end_probe()
+
+    def call_sync(self, fn: Callable[[], T]) -> T:
+        """Blocking version of call for upstream calls made on worker threads."""
+        probe = self.breaker.before_call(self.name)
+        try:
+            with self.limiter:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        result = fn()
+                    except self.retryable_errors as e:
+                        if attempt == self.max_retries:
+                            raise self._give_up(e) from e
+                        time.sleep(self._retry_delay(e, attempt))
+                    else:
+                        self.breaker.record_success()
+                        return result
+        finally:
+            if probe:
+                self.breaker.end_probe()
+
+    async def stream(self, fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        Stream from upstream with admission control.
+
+        Errors before the first item are retried like `call`; once items have
+        been yielded the stream cannot be replayed, so a failure is final.
+        """
+        probe = self.breaker.before_call(self.name)
+        try:
+            async with self.limiter:
+                for attempt in range(self.max_retries + 1):
+                    started = False
+                    try:
+                        async for item in fn():
+                            started = True
+                            yield item
+                    except self.retryable_errors as e:
+                        if started or attempt == self.max_retries:
+                            raise self._give_up(e) from e
+                        await asyncio.sleep(self._retry_delay(e, attempt))
+                    else:
+                        self.breaker.record_success()
+                        return
+        finally:
+            if probe:
+                self.breaker.end_probe()
+
+    def stats(self) -> Dict[str, object]:
+        return {"circuit": self.breaker.state, **self.limiter.stats()}
+
+
+anthropic_upstream = UpstreamClient(
+    "Anthropic API",
+    RETRYABLE_ANTHROPIC_ERRORS,
+    max_concurrency=settings.ANTHROPIC_MAX_CONCURRENCY,
+)
+openai_upstream = UpstreamClient(
+    "OpenAI API",
+    RETRYABLE_OPENAI_ERRORS,
+    max_concurrency=settings.OPENAI_MAX_CONCURRENCY,
+)
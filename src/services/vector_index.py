@@ -0,0 +1,328 @@
+"""
+In-process NumPy vector index.
+
+A personality's corpus is at most a few thousand chunks, so its embeddings
+fit in one contiguous float32 matrix. NumpyVectorStore memory-maps that
+matrix and answers a top-k query with a single matrix-vector product,
+without Chroma's SQLite reads and result serialization on the hot path.
+
+The matrix (`vectors.npy`, rows normalized to unit length) and the chunk
+texts and metadata (`chunks.json`) are exported from the Chroma store into
+the same directory whenever an index is built, and again on load when they
+are missing or were exported from another index version. Chroma stays the
+store of record; VECTOR_BACKEND selects which one serves retrieval.
+"""
+import json
+import os
+import tempfile
+from typing import IO, Any, Callable, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.config import settings
+
+# Metadata key of the cosine similarity attached to search results
+SCORE_KEY = "score"
+
+VECTORS_FILENAME = "vectors.npy"
+CHUNKS_FILENAME = "chunks.json"
+
+# Retrieval backends accepted by VECTOR_BACKEND
+BACKEND_CHROMA = "chroma"
+BACKEND_NUMPY = "numpy"
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Read-only cosine-similarity search over an in-memory or memory-mapped matrix.
+
+    Documents are added by rebuilding the Chroma index and exporting it
+    again, so add_texts is not supported.
+    """
+
+    def __init__(
+        self, vectors: np.ndarray, documents: List[Document], embedding: Embeddings
+    ):
+        if len(vectors) != len(documents):
+            raise ValueError(
+                f"{len(vectors)} vectors do not match {len(documents)} documents"
+            )
+        self.vectors = vectors
+        self.documents = documents
+        self.embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings) -> "NumpyVectorStore":
+        """
+        Load an exported index, memory-mapping its vectors.
+
+        Args:
+            path: Directory holding vectors.npy and chunks.json
+            embedding: The embedding client used for text queries
+
+        Returns:
+            The loaded store
+        """
+        vectors = np.load(os.path.join(path, VECTORS_FILENAME), mmap_mode="r")
+        with open(os.path.join(path, CHUNKS_FILENAME), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        documents = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(chunks["documents"], chunks["metadatas"])
+        ]
+        return cls(vectors, documents, embedding)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        vectors = _normalize(np.asarray(embedding.embed_documents(texts), np.float32))
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(texts, metadatas)
+        ]
+        return cls(vectors, documents, embedding)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        raise NotImplementedError(
+            "NumpyVectorStore is read-only; rebuild the Chroma index instead"
+        )
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        """
+        Find the k documents most similar to a query vector.
+
+        Args:
+            embedding: The query vector
+            k: Number of documents to return
+
+        Returns:
+            (document, cosine similarity) pairs, most similar first
+        """
+        k = min(k, len(self.documents))
+        if k <= 0:
+            return []
+
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        scores = self.vectors @ query
+        # Partial sort: only the top k need ordering
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(self.documents[i], float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k
+        )
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+
+def scored_search(store: VectorStore, embedding: List[float], k: int) -> List[Document]:
+    """
+    Search a vector store and attach each result's cosine similarity.
+
+    Args:
+        store: A NumpyVectorStore or Chroma store
+        embedding: The query vector
+        k: Number of documents to return
+
+    Returns:
+        Copies of the matching documents, most similar first, with the
+        similarity under SCORE_KEY in their metadata
+    """
+    if isinstance(store, NumpyVectorStore):
+        results = store.similarity_search_with_score_by_vector(embedding, k)
+    else:
+        # Chroma returns squared L2 distances; for unit-length embeddings,
+        # such as OpenAI's, the cosine similarity is 1 - distance / 2
+        distances = store.similarity_search_by_vector_with_relevance_scores(
+            embedding, k=k
+        )
+        results = [(doc, 1 - distance / 2) for doc, distance in distances]
+    return [
+        Document(
+            page_content=doc.page_content, metadata={**doc.metadata, SCORE_KEY: score}
+        )
+        for doc, score in results
+    ]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors, or the rows of a matrix, to unit length."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def write_file_atomically(
+    path: str, filename: str, write: Callable[[IO], None], binary: bool = False
+):
+    """
+    Write a file under a unique temporary name and rename it into place.
+
+    Readers see the old or the new file, never a partial one, and several
+    workers exporting at once never write into the same temporary file.
+
+    Args:
+        path: The directory to write to
+        filename: The file's name in the directory
+        write: Writes the content to an open file
+        binary: Whether to open the file in binary mode
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path, prefix=f".{filename}.", suffix=".tmp")
+    try:
+        os.chmod(tmp_path, 0o644)
+        with open(
+            fd, "wb" if binary else "w", encoding=None if binary else "utf-8"
+        ) as f:
+            write(f)
+        os.replace(tmp_path, os.path.join(path, filename))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def export_numpy_index(
+    vector_db: Any, path: str, index_version: Optional[str], write: bool = True
+) -> NumpyVectorStore:
+    """
+    Export a Chroma store's embeddings, texts and metadata to a NumPy index.
+
+    Args:
+        vector_db: The Chroma store to export
+        path: Directory to write vectors.npy and chunks.json to
+        index_version: The Chroma index's version from its manifest
+        write: Whether to write the files; when False, or when the directory
+            is not writable, the index is only built in memory
+
+    Returns:
+        The exported store, memory-mapped when it was written
+    """
+    data = vector_db.get(include=["embeddings", "documents", "metadatas"])
+    vectors = _normalize(np.asarray(data["embeddings"], dtype=np.float32))
+    if not write:
+        return NumpyVectorStore(
+            vectors,
+            [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(data["documents"], data["metadatas"])
+            ],
+            vector_db.embeddings,
+        )
+
+    try:
+        # chunks.json carries the index version, so it is swapped in last:
+        # until then readers see the new vectors with the old version and
+        # treat the export as stale rather than pairing them with old chunks
+        write_file_atomically(
+            path,
+            VECTORS_FILENAME,
+            lambda f: np.save(f, np.ascontiguousarray(vectors)),
+            binary=True,
+        )
+        write_file_atomically(
+            path,
+            CHUNKS_FILENAME,
+            lambda f: json.dump(
+                {
+                    "index_version": index_version,
+                    "ids": data["ids"],
+                    "documents": data["documents"],
+                    "metadatas": data["metadatas"],
+                },
+                f,
+                ensure_ascii=False,
+            ),
+        )
+    except OSError as e:
+        print(f"WARNING: Could not write NumPy index to {path}: {e}")
+        return export_numpy_index(vector_db, path, index_version, write=False)
+
+    print(f"Exported {len(vectors)} vectors to NumPy index at {path}")
+    return NumpyVectorStore.load(path, vector_db.embeddings)
+
+
+def _exported_version(path: str) -> Optional[str]:
+    """Get the index version a NumPy index was exported from, if it exists."""
+    if not os.path.exists(os.path.join(path, VECTORS_FILENAME)):
+        return None
+    try:
+        with open(os.path.join(path, CHUNKS_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f).get("index_version")
+    except (OSError, ValueError):
+        return None
+
+
+def get_exported_store(
+    vector_db: Any, path: str, index_version: Optional[str]
+) -> NumpyVectorStore:
+    """
+    Load a Chroma index's NumPy export, exporting it again if it is stale.
+
+    Args:
+        vector_db: The personality's Chroma store
+        path: The Chroma store's directory
+        index_version: The Chroma index's version from its manifest
+
+    Returns:
+        The NumPy index of the current Chroma index
+    """
+    if index_version and _exported_version(path) == index_version:
+        return NumpyVectorStore.load(path, vector_db.embeddings)
+    return export_numpy_index(
+        vector_db, path, index_version, write=not settings.VECTOR_DB_READ_ONLY
+    )
+
+
+def get_search_store(
+    vector_db: Any, path: str, index_version: Optional[str]
+) -> VectorStore:
+    """
+    Get the vector store that serves similarity searches for a Chroma index.
+
+    Args:
+        vector_db: The personality's Chroma store
+        path: The Chroma store's directory
+        index_version: The Chroma index's version from its manifest
+
+    Returns:
+        The Chroma store itself, or with VECTOR_BACKEND=numpy its NumPy index
+    """
+    if settings.VECTOR_BACKEND != BACKEND_NUMPY:
+        return vector_db
+    return get_exported_store(vector_db, path, index_version)
@@ -0,0 +1,105 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.services.history_store import (
+    InMemoryHistoryStore,
+    RedisHistoryStore,
+    SQLiteHistoryStore,
+    WriteBehindHistoryStore,
+)
+
+
+def _turn(index: int):
+    return [
+        HumanMessage(content=f"question {index}"),
+        AIMessage(content=f"answer {index}"),
+    ]
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = InMemoryHistoryStore()
+    elif request.param == "sqlite":
+        store = SQLiteHistoryStore(str(tmp_path / "sessions.sqlite3"))
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        store = RedisHistoryStore(fakeredis.FakeRedis(), ttl_seconds=60)
+    yield store
+    store.close()
+
+
+def test_append_and_read_back(store):
+    store.append("a", _turn(1))
+    store.append("a", _turn(2))
+    store.append("b", _turn(3))
+
+    assert store.load("a") == _turn(1) + _turn(2)
+    assert store.load("b") == _turn(3)
+    assert store.load("missing") == []
+    assert store.load_with_summary("a") == ("", _turn(1) + _turn(2))
+
+
+def test_compact_trims_and_stores_summary(store):
+    store.append("a", _turn(1) + _turn(2) + _turn(3))
+
+    assert store.compact("a", _turn(1), "summary of turn 1")
+    assert store.load_with_summary("a") == ("summary of turn 1", _turn(2) + _turn(3))
+
+    assert store.compact("a", _turn(2), "summary of turns 1 and 2")
+    assert store.load_with_summary("a") == ("summary of turns 1 and 2", _turn(3))
+
+
+def test_compact_skips_changed_history(store):
+    store.append("a", _turn(1) + _turn(2))
+    assert store.compact("a", _turn(1), "summary of turn 1")
+
+    # Another worker already summarized turn 1
+    assert not store.compact("a", _turn(1), "stale summary")
+    assert store.load_with_summary("a") == ("summary of turn 1", _turn(2))
+
+
+def test_clear_removes_messages_and_summary(store):
+    store.append("a", _turn(1) + _turn(2))
+    store.compact("a", _turn(1), "summary of turn 1")
+    store.clear("a")
+
+    assert store.load_with_summary("a") == ("", [])
+
+
+def test_redis_sessions_expire():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    store = RedisHistoryStore(client, ttl_seconds=60)
+    store.append("a", _turn(1) + _turn(2))
+    store.compact("a", _turn(1), "summary of turn 1")
+
+    assert 0 < client.ttl("history:a") <= 60
+    assert 0 < client.ttl("history:a:summary") <= 60
+
+
+def test_write_behind_flush(store):
+    # A long interval keeps the background thread from flushing first
+    write_behind = WriteBehindHistoryStore(store, flush_interval_seconds=60)
+    write_behind.append("a", _turn(1))
+    write_behind.append("a", _turn(2))
+
+    # Queued writes are visible through the write-behind store only
+    assert store.load("a") == []
+    assert write_behind.load("a") == _turn(1) + _turn(2)
+
+    write_behind.flush()
+    assert store.load("a") == _turn(1) + _turn(2)
+
+    write_behind.clear("a")
+    assert write_behind.load("a") == []
+    write_behind.flush()
+    assert store.load("a") == []
+
+
+def test_write_behind_compact_flushes_queued_writes_first(store):
+    write_behind = WriteBehindHistoryStore(store, flush_interval_seconds=60)
+    write_behind.append("a", _turn(1) + _turn(2))
+
+    assert write_behind.compact("a", _turn(1), "summary of turn 1")
+    assert store.load_with_summary("a") == ("summary of turn 1", _turn(2))
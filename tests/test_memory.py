@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("langchain.memory")
+
+from langchain_core.language_models import FakeListLLM
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from src.services.history_store import InMemoryHistoryStore, StoredChatMessageHistory
+from src.services.memory import TokenBudgetMemory
+
+
+def _memory(store: InMemoryHistoryStore) -> TokenBudgetMemory:
+    """A session's memory as one worker would create it."""
+    return TokenBudgetMemory(
+        llm=FakeListLLM(responses=["The user asked about budgets."]),
+        max_token_limit=20,
+        memory_key="chat_history",
+        return_messages=True,
+        output_key="answer",
+        chat_memory=StoredChatMessageHistory(store, "session"),
+    )
+
+
+def _save(memory: TokenBudgetMemory, index: int):
+    memory.load_memory_variables({})
+    memory.save_context(
+        {"question": f"What is in budget line {index}?"},
+        {"answer": f"Budget line {index} funds the community garden."},
+    )
+
+
+def test_summary_is_shared_through_the_store():
+    store = InMemoryHistoryStore()
+    first_worker = _memory(store)
+    _save(first_worker, 1)
+    _save(first_worker, 2)
+
+    assert first_worker.needs_pruning()
+    first_worker.prune()
+    assert not first_worker.needs_pruning()
+
+    summary, messages = store.load_with_summary("session")
+    assert summary == "The user asked about budgets."
+    assert messages[-2:] == [
+        HumanMessage(content="What is in budget line 2?"),
+        AIMessage(content="Budget line 2 funds the community garden."),
+    ]
+
+    # Another worker continuing the session sees the summary
+    history = _memory(store).load_memory_variables({})["chat_history"]
+    assert history[0] == SystemMessage(content="The user asked about budgets.")
+    assert history[1:] == messages
+
+
+def test_needs_pruning_does_not_read_the_store():
+    store = InMemoryHistoryStore()
+    memory = _memory(store)
+    _save(memory, 1)
+
+    # Turns from another worker are only counted after the next load
+    store.append("session", [HumanMessage(content="x" * 400)])
+    assert not memory.needs_pruning()
+    memory.load_memory_variables({})
+    assert memory.needs_pruning()
+
+
+def test_cjk_history_counts_a_token_per_character():
+    store = InMemoryHistoryStore()
+    memory = _memory(store)
+    store.append("session", [HumanMessage(content="予算" * 20)])
+    memory.load_memory_variables({})
+
+    # Forty characters, far over the limit of 20 tokens
+    assert memory.needs_pruning()
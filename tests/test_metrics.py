@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("langchain.chains")
+
+from prometheus_client import REGISTRY
+
+from src.services import retrieval_engine
+from src.services.answer_cache import AnswerCache
+from src.services.coalescing import SingleFlight
+
+
+class _Engine:
+    def __init__(self):
+        self.answer_cache = AnswerCache(
+            max_entries=10, ttl_seconds=60, similarity_threshold=0.9
+        )
+        self.inflight = SingleFlight()
+
+
+def test_component_stats_are_collected_at_scrape_time(monkeypatch):
+    engine = _Engine()
+    monkeypatch.setattr(retrieval_engine, "loaded_engines", lambda: {"test": engine})
+    engine.answer_cache.get("What is the budget?")
+
+    assert REGISTRY.get_sample_value(
+        "avatar_answer_cache_lookups_total", {"personality": "test", "result": "miss"}
+    ) == 1
+    assert REGISTRY.get_sample_value(
+        "avatar_question_flights_in_progress", {"personality": "test"}
+    ) == 0
+    assert REGISTRY.get_sample_value(
+        "avatar_upstream_circuit_state",
+        {"upstream": "Anthropic API", "state": "closed"},
+    ) == 1
+    assert REGISTRY.get_sample_value("avatar_query_embedding_cache_entries") is not None
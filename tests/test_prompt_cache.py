@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_anthropic")
+pytest.importorskip("langchain.prompts")
+
+from prometheus_client import REGISTRY
+
+from src.bench_prompt_cache import min_cacheable_tokens, start_prompt_cache_server
+from src.services.clients import PooledChatAnthropic
+from src.services.metrics import ANSWER_TAG, run_config
+from src.services.personalities import BasePersonality
+
+MODEL = "claude-3-haiku-20240307"
+
+# Long enough for the static prompt to pass the model's caching minimum
+MODEL_SPEC = "\n".join(
+    f"{i}. The agent weighs the interests of every affected group."
+    for i in range(min_cacheable_tokens(MODEL) // 10)
+)
+
+
+@pytest.fixture
+def server():
+    server = start_prompt_cache_server(ms_per_1k_tokens=0)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def model(server):
+    return PooledChatAnthropic(
+        model=MODEL,
+        max_tokens=100,
+        anthropic_api_key="test",
+        anthropic_api_url=f"http://127.0.0.1:{server.server_port}",
+        max_retries=0,
+    )
+
+
+def _prompt(index: int):
+    return BasePersonality.get_chat_prompt_template(MODEL_SPEC).format_prompt(
+        context=f"Passage {index} about the neighbourhood budget.",
+        question=f"What does passage {index} say about the budget?",
+    )
+
+
+def _tokens(label: str, kind: str) -> float:
+    return REGISTRY.get_sample_value(
+        "avatar_llm_tokens_total",
+        {"personality": label, "call": ANSWER_TAG, "kind": kind},
+    ) or 0
+
+
+def _check_cache_use(server, label: str):
+    # Every request marks the system block; the first writes the cache
+    assert server.requests == [True, True]
+    written = _tokens(label, "cache_write")
+    assert written >= min_cacheable_tokens(MODEL)
+    assert _tokens(label, "cache_read") == written
+    assert _tokens(label, "input") > 2 * written
+
+
+def test_invoke_reads_and_writes_the_prompt_cache(server, model):
+    config = run_config("test-prompt-cache-invoke")
+    for index in range(2):
+        model.invoke(_prompt(index), config=config)
+
+    _check_cache_use(server, "test-prompt-cache-invoke")
+
+
+def test_astream_reads_and_writes_the_prompt_cache(server, model):
+    config = run_config("test-prompt-cache-astream")
+
+    async def ask(index: int) -> str:
+        chunks = model.astream(_prompt(index), config=config)
+        return "".join([chunk.content async for chunk in chunks])
+
+    async def ask_twice():
+        return [await ask(index) for index in range(2)]
+
+    assert all(asyncio.run(ask_twice()))
+    _check_cache_use(server, "test-prompt-cache-astream")
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("langchain.chains")
+
+from src.api.sse import split_sentences
+
+
+def test_split_english_sentences():
+    assert split_sentences("Hello there. It costs 3.5 dollars! How are") == (
+        ["Hello there.", "It costs 3.5 dollars!"],
+        "How are",
+    )
+
+
+def test_english_sentence_waits_for_whitespace():
+    assert split_sentences("It costs 3.") == ([], "It costs 3.")
+
+
+def test_split_japanese_sentences():
+    assert split_sentences("こんにちは。私は地域の代表です！次に") == (
+        ["こんにちは。", "私は地域の代表です！"],
+        "次に",
+    )
+
+
+def test_split_mixed_sentences():
+    assert split_sentences("予算は十分ですか？ Yes. The") == (
+        ["予算は十分ですか？", "Yes."],
+        "The",
+    )
@@ -0,0 +1,81 @@
+import anthropic
+import httpx
+import pytest
+
+from src.config import settings
+from src.services import upstream
+from src.services.upstream import (
+    RETRYABLE_ANTHROPIC_ERRORS,
+    OverloadedError,
+    UpstreamClient,
+)
+
+
+def _status_error(status_code: int) -> anthropic.APIStatusError:
+    """Build the error the Anthropic SDK raises for an HTTP status."""
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status_code, request=request)
+    body = {
+        "type": "error",
+        "error": {"type": "overloaded_error", "message": "Overloaded"},
+    }
+    return anthropic.Client(api_key="test")._make_status_error(
+        "Overloaded", body=body, response=response
+    )
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(upstream.time, "sleep", lambda seconds: None)
+    return UpstreamClient(
+        "Anthropic API", RETRYABLE_ANTHROPIC_ERRORS, max_concurrency=1
+    )
+
+
+def test_overloaded_529_is_retried(client):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            raise _status_error(529)
+        return "answer"
+
+    assert client.call_sync(fn) == "answer"
+    assert len(calls) == 2
+    assert client.breaker.state == "closed"
+
+
+def test_persistent_529_opens_circuit_and_raises_overloaded(client):
+    error = _status_error(529)
+    assert not isinstance(error, anthropic.InternalServerError)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise error
+
+    with pytest.raises(OverloadedError) as raised:
+        client.call_sync(fn)
+    assert raised.value.retry_after >= 1
+    assert len(calls) == 3
+    assert client.breaker.state == "open"
+
+
+@pytest.mark.parametrize("status_code", [503, 504])
+def test_unavailable_and_deadline_errors_are_retryable(status_code):
+    assert isinstance(_status_error(status_code), RETRYABLE_ANTHROPIC_ERRORS)
+
+
+def test_client_errors_are_not_retried(client):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise _status_error(400)
+
+    with pytest.raises(anthropic.BadRequestError):
+        client.call_sync(fn)
+    assert len(calls) == 1